@@ -0,0 +1,121 @@
+# backend/benchmark_queries.py
+"""
+Micro-benchmark of the hot route queries: legacy `Model.query` calls versus
+the prebuilt statements in `wamini_package.app.repository`.
+
+Runs against a throw-away SQLite database seeded with synthetic data and
+reports CPU microseconds per call (process time, so I/O waits are excluded).
+Each case fetches the rows and builds the same dicts the route serializes.
+
+    python benchmark_queries.py --iterations 2000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import warnings
+from datetime import datetime, timedelta
+
+
+def seed(db, models, users=200, products=2000, negotiations=50, messages=100):
+    User, Product, Negotiation, Message = models
+    now = datetime.utcnow()
+    db.session.add_all(
+        User(id=i, name=f"user {i}", password="x", mobile_number=f"+2588{i:07d}", localization="Maputo")
+        for i in range(1, users + 1)
+    )
+    db.session.add_all(
+        Product(name=f"product {i % 40}", quantity=i, price=float(i % 90 + 10), user_id=i % users + 1)
+        for i in range(products)
+    )
+    db.session.flush()
+    db.session.add_all(
+        Negotiation(id=n, user_id=n % users + 1, product_id=n, created_at=now - timedelta(days=1))
+        for n in range(1, negotiations + 1)
+    )
+    db.session.add_all(
+        Message(sender_id=m % users + 1, negotiation_id=n, body=f"message {m}",
+                timestamp=now - timedelta(minutes=messages - m))
+        for n in range(1, negotiations + 1) for m in range(messages)
+    )
+    db.session.commit()
+
+
+def cpu_us_per_call(func, iterations):
+    func()  # warm caches
+    start = time.process_time_ns()
+    for _ in range(iterations):
+        func()
+    return (time.process_time_ns() - start) / iterations / 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "benchmark.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+
+    from wamini_package.app import create_app, repository
+    from wamini_package.app.message_store import thread_filter
+    from wamini_package.app.models import db, User, Product, Negotiation, Message
+
+    # The legacy cases intentionally use Query.get()
+    warnings.filterwarnings("ignore", message=".*Query.get.*")
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        seed(db, (User, Product, Negotiation, Message))
+        negotiation = db.session.get(Negotiation, 1)
+        mobile = "+25880000042"
+
+        cases = {
+            "login_user": (
+                lambda: (lambda u: {"id": u.id, "name": u.name, "pw": u.password})(
+                    User.query.filter_by(mobile_number=mobile).first()),
+                lambda: (lambda u: {"id": u.id, "name": u.name, "pw": u.password})(
+                    repository.find_login_user(mobile)),
+            ),
+            "get_profile": (
+                lambda: (lambda u: {"id": u.id, "name": u.name, "photo": u.photo})(
+                    User.query.get(42)),
+                lambda: (lambda u: {"id": u.id, "name": u.name, "photo": u.photo})(
+                    repository.user_profile(42)),
+            ),
+            "get_messages": (
+                lambda: [{"id": m.id, "sender_id": m.sender_id, "body": m.body, "timestamp": m.timestamp}
+                         for m in Message.query.filter(*thread_filter(negotiation))
+                         .order_by(Message.timestamp.asc()).all()],
+                lambda: [{"id": m.id, "sender_id": m.sender_id, "body": m.body, "timestamp": m.timestamp}
+                         for m in repository.thread_messages(negotiation)],
+            ),
+            "list_negotiations": (
+                lambda: [{"id": n.id, "product_id": n.product_id}
+                         for n in Negotiation.query.filter_by(user_id=2).all()],
+                lambda: [{"id": n.id, "product_id": n.product_id}
+                         for n in repository.negotiations_of(2)],
+            ),
+            "list_products": (
+                lambda: [{"id": p.id, "price": p.price, "user_id": p.user_id}
+                         for p in Product.query.filter_by(deleted_at=None).all()],
+                lambda: [{"id": p.id, "price": p.price, "user_id": p.user_id}
+                         for p in repository.list_products()],
+            ),
+        }
+
+        print(f"{'route':<20}{'legacy us':>12}{'repository us':>16}{'speed-up':>10}")
+        for route, (legacy, current) in cases.items():
+            # Scale iterations down for the routes returning many rows
+            iterations = args.iterations // 20 if route == "list_products" else args.iterations
+            before = cpu_us_per_call(legacy, iterations)
+            db.session.expunge_all()
+            after = cpu_us_per_call(current, iterations)
+            print(f"{route:<20}{before:>12.1f}{after:>16.1f}{before / after:>9.2f}x")
+            db.session.rollback()
+
+
+if __name__ == "__main__":
+    main()
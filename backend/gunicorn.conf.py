@@ -0,0 +1,83 @@
+# backend/gunicorn.conf.py
+"""
+Production server profile for the Wamini API.
+
+Gunicorn loads this file automatically when started from `backend/`:
+
+    gunicorn wamini_package.run:app
+
+With `preload_app` the master imports the package and runs `create_app()`
+(blueprints, extensions) once; workers are forked from it and share those
+pages copy-on-write instead of repeating the work. The master also loads the
+transport quote snapshot (see wamini_package/app/quotes.py) before forking,
+so no worker loads it inside a request. Database connections are never shared
+across the fork: the master disposes its engine after the warm-up and every
+worker drops any inherited pool in `post_fork`.
+
+Environment variables:
+    PORT              Port to bind (default 5000).
+    WEB_CONCURRENCY   Number of worker processes (default 2 * CPUs + 1).
+    GUNICORN_THREADS  Threads per worker (default 1).
+    GUNICORN_PRELOAD  Set to 0 to disable preloading (e.g. to compare).
+"""
+
+import gc
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") != "0"
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers periodically to bound memory growth
+max_requests = 2000
+max_requests_jitter = 200
+
+accesslog = "-"
+
+
+def _warm_quotes():
+    from wamini_package.app.models import db
+    from wamini_package.app.quotes import warm_snapshot
+    from wamini_package.run import app
+
+    warm_snapshot(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def when_ready(server):
+    if preload_app:
+        _warm_quotes()
+        # Move everything allocated while preloading into the permanent GC
+        # generation, so collections in the workers do not touch (and copy)
+        # the shared pages.
+        gc.freeze()
+
+
+def post_worker_init(worker):
+    # Without preloading every worker imports the app itself; warm its
+    # snapshot before it accepts requests.
+    if not preload_app:
+        from wamini_package.app.quotes import warm_snapshot
+        from wamini_package.run import app
+
+        warm_snapshot(app)
+
+
+def post_fork(server, worker):
+    # Drop any pool inherited from the master without closing its sockets;
+    # the worker opens its own connections on first use.
+    if preload_app:
+        from wamini_package.app.models import db
+        from wamini_package.run import app
+
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
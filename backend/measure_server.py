@@ -0,0 +1,115 @@
+# backend/measure_server.py
+"""
+Measure gunicorn start-up time and per-worker memory, with and without
+`preload_app` (see gunicorn.conf.py). Linux only (reads /proc).
+
+Usage (from backend/, with DATABASE_URL etc. set as for the server):
+
+    python measure_server.py --workers 4
+
+For each profile it starts gunicorn, reports the time until the first
+successful response and until every worker is up, then the RSS, PSS and
+private memory of each worker. PSS splits shared pages between the processes
+sharing them, so it shows the copy-on-write savings that RSS hides.
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+
+def children(pid):
+    """PIDs of the direct children of `pid`."""
+    result = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as f:
+            result.extend(int(child) for child in f.read().split())
+    return result
+
+
+def memory_kb(pid):
+    """RSS, PSS and private memory (kB) of a process from smaps_rollup."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:", "Private_Clean:", "Private_Dirty:"):
+                values[parts[0][:-1]] = int(parts[1])
+    return values["Rss"], values["Pss"], values["Private_Clean"] + values["Private_Dirty"]
+
+
+def responds(url):
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status == 200
+    except OSError:
+        return False
+
+
+def measure(preload, workers, port, timeout):
+    env = dict(os.environ, GUNICORN_PRELOAD="1" if preload else "0",
+               WEB_CONCURRENCY=str(workers), PORT=str(port))
+    url = f"http://127.0.0.1:{port}/"
+
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "wamini_package.run:app"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    first_response = all_workers = None
+    try:
+        while time.perf_counter() - started < timeout:
+            if first_response is None and responds(url):
+                first_response = time.perf_counter() - started
+            if first_response is not None and len(children(server.pid)) >= workers:
+                # Hit every worker at least once so each has finished booting
+                for _ in range(workers * 4):
+                    responds(url)
+                all_workers = time.perf_counter() - started
+                break
+            time.sleep(0.05)
+        else:
+            raise RuntimeError("gunicorn did not become ready in time")
+
+        # Let lazy work (first requests, GC) settle before sampling memory
+        time.sleep(1)
+        worker_memory = [memory_kb(pid) for pid in children(server.pid)]
+        master_memory = memory_kb(server.pid)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+
+    return first_response, all_workers, master_memory, worker_memory
+
+
+def report(name, first_response, all_workers, master_memory, worker_memory):
+    print(f"[{name}]")
+    print(f"  time to first response : {first_response * 1000:8.0f} ms")
+    print(f"  time to all workers    : {all_workers * 1000:8.0f} ms")
+    print(f"  master                 : rss={master_memory[0]:7d} kB  pss={master_memory[1]:7d} kB")
+    for i, (rss, pss, private) in enumerate(worker_memory):
+        print(f"  worker {i:<2d}              : rss={rss:7d} kB  pss={pss:7d} kB  private={private:7d} kB")
+    if worker_memory:
+        n = len(worker_memory)
+        print(f"  worker average         : rss={sum(m[0] for m in worker_memory) // n:7d} kB  "
+              f"pss={sum(m[1] for m in worker_memory) // n:7d} kB  "
+              f"private={sum(m[2] for m in worker_memory) // n:7d} kB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    for name, preload in (("without preload", False), ("with preload", True)):
+        report(name, *measure(preload, args.workers, args.port, args.timeout))
+
+
+if __name__ == "__main__":
+    main()
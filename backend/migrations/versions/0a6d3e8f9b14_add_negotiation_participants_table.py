@@ -0,0 +1,57 @@
+"""add negotiation_participants table
+
+Backfills one 'initiator' row per negotiation and one 'owner' row for the
+owner of each listing under discussion, with last_activity set to the
+latest message (or the creation time when there is none).
+
+Revision ID: 0a6d3e8f9b14
+Revises: f27b8d0c5e63
+Create Date: 2026-10-19 17:52:09.483127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0a6d3e8f9b14'
+down_revision = 'f27b8d0c5e63'
+branch_labels = None
+depends_on = None
+
+
+LAST_ACTIVITY = (
+    "COALESCE((SELECT MAX(m.timestamp) FROM messages m WHERE m.negotiation_id = n.id), "
+    "n.created_at, CURRENT_TIMESTAMP)"
+)
+
+
+def upgrade():
+    op.create_table('negotiation_participants',
+    sa.Column('negotiation_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('role', sa.String(length=20), nullable=False),
+    sa.Column('last_activity', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['negotiation_id'], ['negotiations.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('negotiation_id', 'user_id')
+    )
+    op.create_index('ix_negotiation_participants_user_activity', 'negotiation_participants', ['user_id', 'last_activity', 'negotiation_id'], unique=False)
+
+    op.execute(
+        "INSERT INTO negotiation_participants (negotiation_id, user_id, role, last_activity) "
+        f"SELECT n.id, n.user_id, 'initiator', {LAST_ACTIVITY} FROM negotiations n"
+    )
+    for table, column in (('products', 'product_id'), ('inputs', 'input_id'), ('transports', 'transport_id')):
+        op.execute(
+            "INSERT INTO negotiation_participants (negotiation_id, user_id, role, last_activity) "
+            f"SELECT DISTINCT n.id, l.user_id, 'owner', {LAST_ACTIVITY} "
+            f"FROM negotiations n JOIN {table} l ON l.id = n.{column} "
+            "WHERE NOT EXISTS (SELECT 1 FROM negotiation_participants p "
+            "WHERE p.negotiation_id = n.id AND p.user_id = l.user_id)"
+        )
+
+
+def downgrade():
+    op.drop_index('ix_negotiation_participants_user_activity', table_name='negotiation_participants')
+    op.drop_table('negotiation_participants')
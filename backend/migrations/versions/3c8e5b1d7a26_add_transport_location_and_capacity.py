@@ -0,0 +1,30 @@
+"""add transport location and capacity
+
+Revision ID: 3c8e5b1d7a26
+Revises: 0a6d3e8f9b14
+Create Date: 2026-10-19 19:21:44.106583
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c8e5b1d7a26'
+down_revision = '0a6d3e8f9b14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('transports', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('longitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('capacity_kg', sa.Float(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('transports', schema=None) as batch_op:
+        batch_op.drop_column('capacity_kg')
+        batch_op.drop_column('longitude')
+        batch_op.drop_column('latitude')
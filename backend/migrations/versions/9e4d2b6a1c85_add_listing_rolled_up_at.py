@@ -0,0 +1,43 @@
+"""add listing rolled_up_at
+
+Revision ID: 9e4d2b6a1c85
+Revises: 3c8e5b1d7a26
+Create Date: 2026-10-19 21:07:52.318440
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4d2b6a1c85'
+down_revision = '3c8e5b1d7a26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('rolled_up_at', sa.DateTime(), nullable=True))
+
+    with op.batch_alter_table('inputs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('rolled_up_at', sa.DateTime(), nullable=True))
+
+    # Listings at or below the old per-kind watermarks were counted by a rebuild
+    for table, kind in (('products', 'product'), ('inputs', 'input')):
+        op.execute(
+            f"UPDATE {table} SET rolled_up_at = CURRENT_TIMESTAMP "
+            f"WHERE id <= (SELECT value FROM sync_counters WHERE name = 'rollups.{kind}')"
+        )
+    op.execute("DELETE FROM sync_counters WHERE name IN ('rollups.product', 'rollups.input')")
+    op.execute("INSERT INTO sync_counters (name, value) VALUES ('rollups', 0)")
+
+
+def downgrade():
+    op.execute("DELETE FROM sync_counters WHERE name = 'rollups'")
+
+    with op.batch_alter_table('inputs', schema=None) as batch_op:
+        batch_op.drop_column('rolled_up_at')
+
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.drop_column('rolled_up_at')
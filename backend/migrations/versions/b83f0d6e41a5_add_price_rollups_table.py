@@ -0,0 +1,37 @@
+"""add price_rollups table
+
+Revision ID: b83f0d6e41a5
+Revises: 7c1e4b9a2d3f
+Create Date: 2026-10-19 10:03:47.902611
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b83f0d6e41a5'
+down_revision = '7c1e4b9a2d3f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('price_rollups',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('name_key', sa.String(length=120), nullable=False),
+    sa.Column('region', sa.String(length=255), nullable=False),
+    sa.Column('bucket', sa.String(length=10), nullable=False),
+    sa.Column('bucket_start', sa.Date(), nullable=False),
+    sa.Column('sample_count', sa.Integer(), nullable=False),
+    sa.Column('price_total', sa.Float(), nullable=False),
+    sa.Column('price_min', sa.Float(), nullable=False),
+    sa.Column('price_max', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('kind', 'name_key', 'bucket', 'region', 'bucket_start', name='uq_price_rollups_key')
+    )
+
+
+def downgrade():
+    op.drop_table('price_rollups')
@@ -0,0 +1,116 @@
+"""partition messages by month
+
+Adds negotiations.closed_at/archived_at and an index on
+messages (negotiation_id, timestamp). On PostgreSQL the messages table is
+rebuilt as a table range-partitioned by timestamp month, with one partition
+per month holding data, the next three months, and a default partition.
+Messages without a timestamp are given the current time and the column
+becomes NOT NULL on every database.
+
+Revision ID: d4a9c2e7f018
+Revises: b83f0d6e41a5
+Create Date: 2026-10-19 11:26:13.557190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a9c2e7f018'
+down_revision = 'b83f0d6e41a5'
+branch_labels = None
+depends_on = None
+
+
+PARTITION_SQL = """
+ALTER TABLE messages RENAME TO messages_legacy;
+ALTER TABLE messages_legacy RENAME CONSTRAINT messages_pkey TO messages_legacy_pkey;
+ALTER SEQUENCE messages_id_seq OWNED BY NONE;
+
+CREATE TABLE messages (
+    id integer NOT NULL DEFAULT nextval('messages_id_seq'),
+    sender_id integer NOT NULL REFERENCES users (id),
+    negotiation_id integer NOT NULL REFERENCES negotiations (id),
+    body text NOT NULL,
+    "timestamp" timestamp without time zone NOT NULL,
+    PRIMARY KEY (id, "timestamp")
+) PARTITION BY RANGE ("timestamp");
+
+ALTER SEQUENCE messages_id_seq OWNED BY messages.id;
+
+CREATE TABLE messages_default PARTITION OF messages DEFAULT;
+
+DO $$
+DECLARE
+    month_start date;
+    last_month date := date_trunc('month', now()) + interval '3 months';
+BEGIN
+    SELECT COALESCE(date_trunc('month', min("timestamp")), date_trunc('month', now()))
+      INTO month_start FROM messages_legacy;
+    WHILE month_start <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L)',
+            'messages_y' || to_char(month_start, 'YYYY') || 'm' || to_char(month_start, 'MM'),
+            month_start, month_start + interval '1 month'
+        );
+        month_start := month_start + interval '1 month';
+    END LOOP;
+END $$;
+
+INSERT INTO messages (id, sender_id, negotiation_id, body, "timestamp")
+SELECT id, sender_id, negotiation_id, body, COALESCE("timestamp", now() AT TIME ZONE 'utc')
+FROM messages_legacy;
+
+DROP TABLE messages_legacy;
+"""
+
+UNPARTITION_SQL = """
+ALTER TABLE messages RENAME TO messages_partitioned;
+ALTER TABLE messages_partitioned RENAME CONSTRAINT messages_pkey TO messages_partitioned_pkey;
+ALTER SEQUENCE messages_id_seq OWNED BY NONE;
+
+CREATE TABLE messages (
+    id integer NOT NULL DEFAULT nextval('messages_id_seq') PRIMARY KEY,
+    sender_id integer NOT NULL REFERENCES users (id),
+    negotiation_id integer NOT NULL REFERENCES negotiations (id),
+    body text NOT NULL,
+    "timestamp" timestamp without time zone
+);
+
+ALTER SEQUENCE messages_id_seq OWNED BY messages.id;
+
+INSERT INTO messages (id, sender_id, negotiation_id, body, "timestamp")
+SELECT id, sender_id, negotiation_id, body, "timestamp" FROM messages_partitioned;
+
+DROP TABLE messages_partitioned;
+"""
+
+
+def upgrade():
+    with op.batch_alter_table('negotiations', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('closed_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('archived_at', sa.DateTime(), nullable=True))
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(PARTITION_SQL)
+    else:
+        op.execute('UPDATE messages SET "timestamp" = CURRENT_TIMESTAMP WHERE "timestamp" IS NULL')
+        with op.batch_alter_table('messages', schema=None) as batch_op:
+            batch_op.alter_column('timestamp', existing_type=sa.DateTime(), nullable=False)
+
+    op.create_index('ix_messages_negotiation_id_timestamp', 'messages', ['negotiation_id', 'timestamp'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_messages_negotiation_id_timestamp', table_name='messages')
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(UNPARTITION_SQL)
+    else:
+        with op.batch_alter_table('messages', schema=None) as batch_op:
+            batch_op.alter_column('timestamp', existing_type=sa.DateTime(), nullable=True)
+
+    with op.batch_alter_table('negotiations', schema=None) as batch_op:
+        batch_op.drop_column('archived_at')
+        batch_op.drop_column('closed_at')
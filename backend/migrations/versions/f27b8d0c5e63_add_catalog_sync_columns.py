@@ -0,0 +1,67 @@
+"""add catalog sync columns
+
+Adds updated_at, deleted_at and change_seq to products, inputs and
+transports, and the sync_counters table. Existing rows are given change
+tokens in table order and the 'catalog' counter starts after the last one.
+
+Revision ID: f27b8d0c5e63
+Revises: e5f1a7b3c920
+Create Date: 2026-10-19 15:08:30.774415
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f27b8d0c5e63'
+down_revision = 'e5f1a7b3c920'
+branch_labels = None
+depends_on = None
+
+
+SYNCED_TABLES = ('products', 'inputs', 'transports')
+
+
+def _max_change_seq(tables):
+    """SQL expression for the highest change_seq across `tables` (0 if none)."""
+    if not tables:
+        return "0"
+    union = " UNION ALL ".join(f"SELECT change_seq FROM {table}" for table in tables)
+    return f"SELECT COALESCE(MAX(change_seq), 0) FROM ({union}) AS previous_changes"
+
+
+def upgrade():
+    op.create_table('sync_counters',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+    for table in SYNCED_TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+            batch_op.add_column(sa.Column('deleted_at', sa.DateTime(), nullable=True))
+            batch_op.add_column(sa.Column('change_seq', sa.BigInteger(), nullable=True))
+            batch_op.create_index(batch_op.f(f'ix_{table}_change_seq'), ['change_seq'], unique=False)
+
+    # Backfill: number existing rows table after table, then start the counter
+    for i, table in enumerate(SYNCED_TABLES):
+        op.execute(
+            f"UPDATE {table} SET updated_at = publish_date, "
+            f"change_seq = id + ({_max_change_seq(SYNCED_TABLES[:i])})"
+        )
+    op.execute(
+        f"INSERT INTO sync_counters (name, value) VALUES ('catalog', ({_max_change_seq(SYNCED_TABLES)}))"
+    )
+
+
+def downgrade():
+    for table in reversed(SYNCED_TABLES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(batch_op.f(f'ix_{table}_change_seq'))
+            batch_op.drop_column('change_seq')
+            batch_op.drop_column('deleted_at')
+            batch_op.drop_column('updated_at')
+
+    op.drop_table('sync_counters')
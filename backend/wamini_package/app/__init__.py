@@ -3,15 +3,23 @@ __init__.py
 -------------------------------------------------------------------------
 
 Initializes and registers all route blueprints for Wamini backend API.
-Compatible with Render Free deployment. Automatically creates tables on first request.
+Compatible with Render Free deployment. Automatically creates tables on first request,
+unless the database is managed by migrations (`flask db upgrade`).
 """
 
 import os
+import threading
+import click
 from flask import Flask
 from flask_cors import CORS
-from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
+from sqlalchemy import inspect
 from wamini_package.app.models import db
+from wamini_package.app.jobs import jobs_cli
+from wamini_package.app.analytics import analytics_cli
+from wamini_package.app.message_store import messages_cli
+from wamini_package.app.idempotency import idempotency_cli
+from wamini_package.app.profiling import init_profiling, profiling_cli
 
 # Import blueprints from routes
 from wamini_package.app.routes.routes import (
@@ -19,9 +27,59 @@ from wamini_package.app.routes.routes import (
     product_bp,
     input_bp,
     transport_bp,
-    negotiation_bp
+    negotiation_bp,
+    analytics_bp,
+    sync_bp
 )
 
+class LazyMigrateGroup(click.Group):
+    """
+    `flask db` command group that imports Flask-Migrate (and Alembic) only when
+    a `flask db ...` command is actually used, instead of in every web worker.
+    """
+
+    def __init__(self, app, **kwargs):
+        super().__init__(name="db", help="Perform database migrations.", **kwargs)
+        self.app = app
+
+    def _load(self):
+        from flask_migrate import Migrate
+        from flask_migrate.cli import db as db_group
+
+        if "migrate" not in self.app.extensions:
+            Migrate(self.app, db)
+        return db_group
+
+    def make_context(self, info_name, args, parent=None, **extra):
+        # Hand parsing and invocation over to the real Flask-Migrate group
+        return self._load().make_context(info_name, args, parent=parent, **extra)
+
+
+def create_tables_once(app):
+    """
+    Create missing tables on the first request (works in Render Free).
+
+    Nothing is created while the app is only loaded for a CLI command, so
+    `flask db upgrade` always starts from the schema the migrations expect,
+    and nothing is created at all once the database has an `alembic_version`
+    table: from then on the schema only changes through migrations.
+    """
+    lock = threading.Lock()
+    done = False
+
+    @app.before_request
+    def create_tables():
+        nonlocal done
+        if done:
+            return
+        with lock:
+            if not done:
+                if not inspect(db.engine).has_table("alembic_version"):
+                    db.create_all()
+                    print("All tables created successfully!")
+                done = True
+
+
 def create_app():
     """
     Application factory that initializes Flask app and registers all route blueprints.
@@ -44,11 +102,21 @@ def create_app():
     app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY')
     app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')  # Use Render external DB URL
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Must be shared, durable storage (archived messages only live there)
+    app.config['MESSAGE_ARCHIVE_DIR'] = os.getenv('MESSAGE_ARCHIVE_DIR')
+    app.config['IDEMPOTENCY_KEY_TTL'] = int(os.getenv('IDEMPOTENCY_KEY_TTL', 24 * 3600))
+    app.config['IDEMPOTENCY_IN_FLIGHT_TIMEOUT'] = int(os.getenv('IDEMPOTENCY_IN_FLIGHT_TIMEOUT', 60))
+
+    # Request profiling (off unless PROFILING_ENABLED is set)
+    app.config['PROFILING_ENABLED'] = os.getenv('PROFILING_ENABLED', '').lower() in ('1', 'true')
+    app.config['PROFILE_SAMPLE_RATE'] = float(os.getenv('PROFILE_SAMPLE_RATE', 0.0))
+    app.config['PROFILE_INTERVAL_MS'] = float(os.getenv('PROFILE_INTERVAL_MS', 5))
+    app.config['PROFILE_TOKEN_MAX_AGE'] = int(os.getenv('PROFILE_TOKEN_MAX_AGE', 3600))
+    app.config['PROFILE_DIR'] = os.getenv('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
 
     # Initialize extensions
     db.init_app(app)
     JWTManager(app)
-    migrate = Migrate(app, db)
 
     # Register Blueprints
     app.register_blueprint(user_bp)
@@ -56,13 +124,24 @@ def create_app():
     app.register_blueprint(input_bp)
     app.register_blueprint(transport_bp)
     app.register_blueprint(negotiation_bp)
+    app.register_blueprint(analytics_bp)
+    app.register_blueprint(sync_bp)
+
+    if app.config['PROFILING_ENABLED']:
+        init_profiling(app)
+
+    # CLI commands (flask jobs|analytics|messages|idempotency|profiling ...)
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(analytics_cli)
+    app.cli.add_command(messages_cli)
+    app.cli.add_command(idempotency_cli)
+    app.cli.add_command(profiling_cli)
+    app.cli.add_command(LazyMigrateGroup(app))
 
     @app.route("/")
     def index():
         return "Wamini API is running!"
     # Automatically create all tables on the first request (works in Render Free)
-    with app.app_context():
-        db.create_all()
-        print("All tables created successfully!")
+    create_tables_once(app)
 
     return app
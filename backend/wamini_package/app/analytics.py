@@ -0,0 +1,303 @@
+"""
+analytics.py
+----------
+Price statistics for products and inputs.
+
+Statistics are served from the ``price_rollups`` table, which holds one row
+per (kind, normalized name, region, day/week bucket) with the count, sum, min
+and max of the listing prices. Reads therefore never scan the raw listings.
+
+Maintenance:
+    - Incremental: publishing a product or input enqueues an
+      'analytics.record_price' job that upserts its day and week rows.
+    - Batch: ``flask analytics rebuild`` recomputes every rollup from the raw
+      tables with a single vectorized NumPy pass. NumPy is imported inside the
+      rebuild functions; web workers load it anyway for transport quotes (see
+      quotes.py), once in the preloaded master.
+
+A rebuild can run while job workers are still applying 'analytics.record_price'
+jobs. Every listing carries a ``rolled_up_at`` marker: the rebuild sets it on
+the listings it counts and a job sets it in the same transaction as its
+upsert, only if it is still unset, and skips the listing otherwise. Each
+listing is therefore counted exactly once, whatever order listings were
+committed in. Jobs hold a shared lock on the 'rollups' row of
+``sync_counters`` while they upsert and the rebuild an exclusive one, so the
+two never interleave.
+"""
+
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import delete, func, insert, select, update
+
+from .jobs import job
+from .models import db, User, Product, Input, PriceRollup, SyncCounter
+
+LISTING_MODELS = {"product": Product, "input": Input}
+BUCKETS = ("day", "week")
+
+_KEY_COLUMNS = ["kind", "name_key", "bucket", "region", "bucket_start"]
+
+
+def normalize(text):
+    """Lower-case and collapse whitespace so 'Maize ' and 'maize' share a key."""
+    return " ".join((text or "").lower().split())
+
+
+def bucket_start(day, bucket):
+    """Return the first day of the `bucket` containing `day` (weeks start Monday)."""
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+# -----------------------------------------------------------------------------
+# Incremental maintenance
+# -----------------------------------------------------------------------------
+
+def _upsert(values):
+    """Insert a rollup row or merge `values` into the existing one."""
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        least, greatest = func.least, func.greatest
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        # SQLite's multi-argument min()/max() are scalar functions
+        least, greatest = func.min, func.max
+    else:
+        raise RuntimeError(f"Price rollups are not supported on '{dialect}'")
+
+    stmt = dialect_insert(PriceRollup).values(**values)
+    excluded = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=_KEY_COLUMNS,
+        set_={
+            "sample_count": PriceRollup.sample_count + excluded.sample_count,
+            "price_total": PriceRollup.price_total + excluded.price_total,
+            "price_min": least(PriceRollup.price_min, excluded.price_min),
+            "price_max": greatest(PriceRollup.price_max, excluded.price_max),
+        }
+    )
+    db.session.execute(stmt)
+
+
+def record_price(kind, name, region, price, published_at):
+    """Add one listing price to its day and week rollups."""
+    for bucket in BUCKETS:
+        _upsert({
+            "kind": kind,
+            "name_key": normalize(name),
+            "region": normalize(region),
+            "bucket": bucket,
+            "bucket_start": bucket_start(published_at.date(), bucket),
+            "sample_count": 1,
+            "price_total": price,
+            "price_min": price,
+            "price_max": price,
+        })
+
+
+ROLLUP_LOCK = "rollups"
+
+
+def _lock_rollups(exclusive=False):
+    """Lock the 'rollups' row: shared for jobs, exclusive for a rebuild."""
+    db.session.execute(
+        select(SyncCounter.value)
+        .where(SyncCounter.name == ROLLUP_LOCK)
+        .with_for_update(read=not exclusive)
+    )
+
+
+@job("analytics.record_price")
+def record_listing_price(kind, listing_id):
+    """Job handler: fold a newly published listing into the rollups."""
+    _lock_rollups()
+    model = LISTING_MODELS[kind]
+    marked = db.session.execute(
+        update(model)
+        .where(model.id == listing_id, model.rolled_up_at.is_(None))
+        .values(rolled_up_at=datetime.utcnow())
+    ).rowcount
+    if not marked:
+        return  # missing, or already counted by a rebuild or an earlier run
+    listing = db.session.get(model, listing_id)
+    user = db.session.get(User, listing.user_id)
+    record_price(kind, listing.name, user.localization if user else None,
+                 listing.price, listing.publish_date)
+
+
+# -----------------------------------------------------------------------------
+# Batch rebuild
+# -----------------------------------------------------------------------------
+
+def aggregate(names, regions, prices, days):
+    """
+    Aggregate raw listing prices into rollup buckets.
+
+    Args:
+        names (list[str]): Normalized item names.
+        regions (list[str]): Normalized regions.
+        prices (np.ndarray): Listing prices (float64).
+        days (np.ndarray): Publication days (datetime64[D]).
+
+    Returns:
+        list[dict]: One dict per (bucket, name, region, bucket_start) group.
+    """
+    import numpy as np
+
+    if len(prices) == 0:
+        return []
+
+    # Factorize the string part of the key once; the date part stays numeric.
+    labels = {}
+    label_codes = np.fromiter(
+        (labels.setdefault(key, len(labels)) for key in zip(names, regions)),
+        dtype=np.int64, count=len(prices)
+    )
+    label_list = list(labels)
+    day_numbers = days.astype(np.int64)
+
+    rows = []
+    for bucket in BUCKETS:
+        if bucket == "week":
+            # 1970-01-01 was a Thursday: shift by 3 so weeks start on Monday
+            starts = day_numbers - (day_numbers + 3) % 7
+        else:
+            starts = day_numbers
+
+        order = np.lexsort((starts, label_codes))
+        sorted_codes = label_codes[order]
+        sorted_starts = starts[order]
+        sorted_prices = prices[order]
+
+        boundary = np.ones(len(order), dtype=bool)
+        boundary[1:] = (sorted_codes[1:] != sorted_codes[:-1]) | (sorted_starts[1:] != sorted_starts[:-1])
+        group_index = np.flatnonzero(boundary)
+
+        counts = np.diff(np.append(group_index, len(order)))
+        totals = np.add.reduceat(sorted_prices, group_index)
+        mins = np.minimum.reduceat(sorted_prices, group_index)
+        maxs = np.maximum.reduceat(sorted_prices, group_index)
+        group_days = sorted_starts[group_index].astype("datetime64[D]").astype(object)
+
+        for i, first in enumerate(group_index):
+            name_key, region = label_list[sorted_codes[first]]
+            rows.append({
+                "name_key": name_key,
+                "region": region,
+                "bucket": bucket,
+                "bucket_start": group_days[i],
+                "sample_count": int(counts[i]),
+                "price_total": float(totals[i]),
+                "price_min": float(mins[i]),
+                "price_max": float(maxs[i]),
+            })
+    return rows
+
+
+def rebuild_rollups():
+    """Recompute all rollups from the raw listing tables. Returns rows written."""
+    import numpy as np
+
+    # Lock first: running jobs finish, new ones wait for the commit
+    if db.session.get(SyncCounter, ROLLUP_LOCK) is None:
+        db.session.add(SyncCounter(name=ROLLUP_LOCK, value=0))
+        db.session.flush()
+    _lock_rollups(exclusive=True)
+
+    db.session.execute(delete(PriceRollup))
+    written = 0
+    # Marks exactly the rows counted below: no job can set a marker meanwhile
+    # and older markers hold an earlier time.
+    marked_at = datetime.utcnow()
+
+    for kind, model in LISTING_MODELS.items():
+        db.session.execute(
+            update(model)
+            .where(model.publish_date.isnot(None))
+            .values(rolled_up_at=marked_at)
+        )
+        listing_rows = db.session.execute(
+            select(model.name, User.localization, model.price, model.publish_date)
+            .join(User, User.id == model.user_id)
+            .where(model.rolled_up_at == marked_at)
+        ).all()
+        if not listing_rows:
+            continue
+
+        names, regions, prices, published = zip(*listing_rows)
+        rows = aggregate(
+            [normalize(n) for n in names],
+            [normalize(r) for r in regions],
+            np.asarray(prices, dtype=np.float64),
+            np.array([p.date() for p in published], dtype="datetime64[D]")
+        )
+        for row in rows:
+            row["kind"] = kind
+        if rows:
+            db.session.execute(insert(PriceRollup), rows)
+        written += len(rows)
+
+    db.session.commit()
+    return written
+
+
+# -----------------------------------------------------------------------------
+# Queries
+# -----------------------------------------------------------------------------
+
+def price_series(kind, name, bucket="day", region=None, start=None, end=None):
+    """
+    Return the price series for one item, oldest bucket first.
+
+    When `region` is None the per-region rollups are merged into one series.
+    """
+    conditions = [
+        PriceRollup.kind == kind,
+        PriceRollup.name_key == normalize(name),
+        PriceRollup.bucket == bucket,
+    ]
+    if region is not None:
+        conditions.append(PriceRollup.region == normalize(region))
+    if start is not None:
+        conditions.append(PriceRollup.bucket_start >= start)
+    if end is not None:
+        conditions.append(PriceRollup.bucket_start <= end)
+
+    stmt = (
+        select(
+            PriceRollup.bucket_start,
+            func.sum(PriceRollup.sample_count),
+            func.sum(PriceRollup.price_total),
+            func.min(PriceRollup.price_min),
+            func.max(PriceRollup.price_max),
+        )
+        .where(*conditions)
+        .group_by(PriceRollup.bucket_start)
+        .order_by(PriceRollup.bucket_start.asc())
+    )
+
+    return [{
+        "bucket_start": day.isoformat(),
+        "count": count,
+        "avg": total / count,
+        "min": low,
+        "max": high
+    } for day, count, total, low, high in db.session.execute(stmt)]
+
+
+# -----------------------------------------------------------------------------
+# CLI
+# -----------------------------------------------------------------------------
+
+analytics_cli = AppGroup("analytics", help="Maintain price analytics rollups.")
+
+
+@analytics_cli.command("rebuild")
+def rebuild_command():
+    """Recompute all price rollups from the listing tables."""
+    written = rebuild_rollups()
+    click.echo(f"Wrote {written} price rollup row(s).")
@@ -0,0 +1,206 @@
+"""
+idempotency.py
+----------
+`Idempotency-Key` support for write routes.
+
+A POST decorated with ``@idempotent`` and sent with an ``Idempotency-Key``
+header reserves that key in the ``idempotency_keys`` table before the route
+runs. The key row joins the route's transaction, so it is committed by the
+route's own commit, still without a response (``status_code`` NULL, "in
+flight"); the response is stored by a second, small commit once the route
+returns:
+
+    - First request: the key row is inserted (guarded by a unique index on
+      (scope, key)), the route runs, and its response is stored.
+    - Retry after success: the stored response is replayed without running
+      the route again (``Idempotent-Replayed: true``).
+    - Concurrent duplicate: the unique index blocks the second insert until the
+      first transaction ends; while the first request is in flight, 409 is
+      returned instead of writing a duplicate row.
+    - Route failure (exception or 5xx): uncommitted changes are rolled back
+      and the key is released so the client can retry. Changes the route had
+      already committed stay.
+    - Crash between the route's commit and the response commit: the key stays
+      in flight. After ``IDEMPOTENCY_IN_FLIGHT_TIMEOUT`` seconds it is treated
+      as abandoned and the next retry reclaims it and runs the route again.
+
+Keys are scoped per caller and route and expire after ``IDEMPOTENCY_KEY_TTL``
+seconds; ``flask idempotency purge`` deletes expired rows.
+"""
+
+import hashlib
+from datetime import datetime, timedelta
+from functools import wraps
+
+import click
+from flask import current_app, jsonify, make_response, request
+from flask.cli import AppGroup
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+
+from .jobs import job
+from .models import db, IdempotencyKey
+
+HEADER = "Idempotency-Key"
+DEFAULT_TTL = 24 * 3600
+DEFAULT_IN_FLIGHT_TIMEOUT = 60
+MAX_KEY_LENGTH = 255
+
+
+def _claim(key, scope, request_hash):
+    """
+    Reserve `key` for this request.
+
+    Returns:
+        tuple: (new IdempotencyKey, None) when reserved, or
+               (None, existing IdempotencyKey) when the key is already in use.
+    """
+    now = datetime.utcnow()
+    ttl = current_app.config.get("IDEMPOTENCY_KEY_TTL", DEFAULT_TTL)
+    abandoned_before = now - timedelta(
+        seconds=current_app.config.get("IDEMPOTENCY_IN_FLIGHT_TIMEOUT", DEFAULT_IN_FLIGHT_TIMEOUT))
+
+    # Two passes at most: the second one follows the removal of an expired
+    # or abandoned key.
+    for _ in range(2):
+        record = IdempotencyKey(
+            key=key,
+            scope=scope,
+            request_hash=request_hash,
+            created_at=now,
+            expires_at=now + timedelta(seconds=ttl)
+        )
+        # The route has not touched the session yet, so a rollback on conflict
+        # discards nothing but the failed insert.
+        db.session.add(record)
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            existing = db.session.execute(
+                select(IdempotencyKey).where(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+            ).scalar_one_or_none()
+            if existing is None:
+                continue
+            if existing.expires_at <= now:
+                _release(existing.id)
+                continue
+            if existing.status_code is None and existing.created_at < abandoned_before:
+                # Only the retry whose delete wins reclaims the key
+                if _release(existing.id, abandoned_before):
+                    continue
+                return None, None
+            return None, existing
+        return record, None
+
+    return None, None
+
+
+def _release(key_id, abandoned_before=None):
+    """
+    Delete a key row so the key can be claimed again.
+
+    With `abandoned_before`, only an in-flight row created before that time is
+    deleted. Returns whether a row was deleted.
+    """
+    stmt = delete(IdempotencyKey).where(IdempotencyKey.id == key_id)
+    if abandoned_before is not None:
+        stmt = stmt.where(
+            IdempotencyKey.status_code.is_(None),
+            IdempotencyKey.created_at < abandoned_before
+        )
+    deleted = db.session.execute(stmt).rowcount
+    db.session.commit()
+    return deleted > 0
+
+
+def _replay(existing, request_hash):
+    """Build the response for a request whose key was already used."""
+    if existing is None or existing.status_code is None:
+        response = jsonify({"error": f"A request with this {HEADER} is still in progress"})
+        response.status_code = 409
+    elif existing.request_hash != request_hash:
+        response = jsonify({"error": f"{HEADER} was already used with a different request"})
+        response.status_code = 422
+    else:
+        response = jsonify(existing.response_body)
+        response.status_code = existing.status_code
+        response.headers["Idempotent-Replayed"] = "true"
+
+    # Nothing was written; end the read transaction
+    db.session.rollback()
+    return response
+
+
+def idempotent(view):
+    """
+    Make a write route safe to retry with an `Idempotency-Key` header.
+
+    Place it below ``@jwt_required()`` so keys are scoped to the caller.
+    Requests without the header are passed through untouched.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({"error": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters"}), 400
+
+        verify_jwt_in_request(optional=True)
+        scope = f"{get_jwt_identity() or 'anonymous'}:{request.method} {request.path}"
+        request_hash = hashlib.sha256(request.get_data()).hexdigest()
+
+        record, existing = _claim(key, scope, request_hash)
+        if record is None:
+            return _replay(existing, request_hash)
+        key_id = record.id
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            # The route may have committed the key already
+            _release(key_id)
+            raise
+
+        if response.status_code >= 500:
+            db.session.rollback()
+            _release(key_id)
+            return response
+
+        record.status_code = response.status_code
+        record.response_body = response.get_json(silent=True)
+        db.session.commit()
+        return response
+
+    return wrapper
+
+
+def purge_expired():
+    """Delete expired idempotency keys. Returns the number of rows removed."""
+    result = db.session.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.expires_at < datetime.utcnow())
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+@job("idempotency.purge_expired")
+def purge_expired_job():
+    """Job handler: delete expired idempotency keys."""
+    purge_expired()
+
+
+# -----------------------------------------------------------------------------
+# CLI
+# -----------------------------------------------------------------------------
+
+idempotency_cli = AppGroup("idempotency", help="Maintain stored idempotency keys.")
+
+
+@idempotency_cli.command("purge")
+def purge_command():
+    """Delete expired idempotency keys."""
+    click.echo(f"Purged {purge_expired()} expired idempotency key(s).")
@@ -0,0 +1,437 @@
+"""
+jobs.py
+----------
+Background job queue for the Wamini API.
+
+Request handlers only *enqueue* work (notifications, cleanup, reconciliation)
+by adding a row to the ``jobs`` table inside their own transaction, so the
+write path stays short. Workers started with ``flask jobs work`` claim and run
+those rows outside the request path.
+
+Claiming:
+    - PostgreSQL: ``SELECT ... FOR UPDATE SKIP LOCKED`` so concurrent workers
+      never block on, or run, the same row.
+    - SQLite (local development): no row locks exist, so a conditional
+      ``UPDATE ... WHERE status = 'queued'`` acts as the claim instead.
+
+Failed jobs are retried with exponential backoff until ``max_attempts`` is
+reached. Each worker keeps queue-latency and run-time metrics per job name and
+logs them periodically.
+"""
+
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, func, select, update
+
+from . import repository
+from .models import db, Job, Message
+
+logger = logging.getLogger(__name__)
+
+# Retry delay is BACKOFF_BASE * 2 ** (attempt - 1) seconds, capped at BACKOFF_MAX
+BACKOFF_BASE = 5
+BACKOFF_MAX = 3600
+
+_handlers = {}
+
+
+def job(name):
+    """Register the decorated function as the handler for jobs called `name`."""
+    def decorator(func):
+        _handlers[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, delay=0, max_attempts=5):
+    """
+    Queue a job in the current session.
+
+    The job is committed together with the caller's own changes, so it is only
+    ever run if the write that triggered it succeeded.
+
+    Args:
+        name (str): Registered handler name.
+        payload (dict): Keyword arguments passed to the handler.
+        delay (int): Seconds to wait before the job becomes runnable.
+        max_attempts (int): Attempts allowed before the job is marked 'failed'.
+
+    Returns:
+        Job: The pending job instance.
+    """
+    new_job = Job(
+        name=name,
+        payload=payload or {},
+        max_attempts=max_attempts,
+        run_at=datetime.utcnow() + timedelta(seconds=delay)
+    )
+    db.session.add(new_job)
+    return new_job
+
+
+# -----------------------------------------------------------------------------
+# Metrics
+# -----------------------------------------------------------------------------
+
+class JobMetrics:
+    """Thread-safe per-job-name counters and latency totals for one worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def observe(self, name, queue_latency, run_time, outcome):
+        """Record one attempt; `outcome` is 'done', 'retried' or 'failed'."""
+        with self._lock:
+            s = self._stats.setdefault(name, {
+                "done": 0, "retried": 0, "failed": 0,
+                "latency_total": 0.0, "latency_max": 0.0, "run_total": 0.0
+            })
+            s[outcome] += 1
+            s["latency_total"] += queue_latency
+            s["latency_max"] = max(s["latency_max"], queue_latency)
+            s["run_total"] += run_time
+
+    def snapshot(self):
+        """Return a copy of the current stats with averages computed."""
+        with self._lock:
+            result = {}
+            for name, s in self._stats.items():
+                attempts = s["done"] + s["retried"] + s["failed"]
+                result[name] = {
+                    "done": s["done"],
+                    "retried": s["retried"],
+                    "failed": s["failed"],
+                    "latency_avg": s["latency_total"] / attempts,
+                    "latency_max": s["latency_max"],
+                    "run_avg": s["run_total"] / attempts
+                }
+            return result
+
+    def log(self):
+        for name, s in sorted(self.snapshot().items()):
+            logger.info(
+                "job=%s done=%d retried=%d failed=%d latency_avg=%.3fs latency_max=%.3fs run_avg=%.3fs",
+                name, s["done"], s["retried"], s["failed"],
+                s["latency_avg"], s["latency_max"], s["run_avg"]
+            )
+
+
+# -----------------------------------------------------------------------------
+# Claiming and execution
+# -----------------------------------------------------------------------------
+
+def claim_next():
+    """
+    Claim the next runnable job and mark it 'running'.
+
+    Returns:
+        Job | None: The claimed job, or None when nothing is runnable.
+    """
+    now = datetime.utcnow()
+    stmt = (
+        select(Job)
+        .where(Job.status == 'queued', Job.run_at <= now)
+        .order_by(Job.run_at)
+        .limit(1)
+    )
+
+    if db.engine.dialect.name == 'postgresql':
+        claimed = db.session.execute(stmt.with_for_update(skip_locked=True)).scalar_one_or_none()
+        if claimed is None:
+            db.session.rollback()
+            return None
+        claimed.status = 'running'
+        claimed.started_at = now
+        claimed.attempts += 1
+        db.session.commit()
+        return claimed
+
+    # Fallback for databases without SKIP LOCKED: the conditional UPDATE only
+    # succeeds for the first worker that sees the row as still queued.
+    candidate = db.session.execute(stmt).scalar_one_or_none()
+    if candidate is None:
+        db.session.rollback()
+        return None
+    result = db.session.execute(
+        update(Job)
+        .where(Job.id == candidate.id, Job.status == 'queued')
+        .values(status='running', started_at=now, attempts=Job.attempts + 1)
+    )
+    db.session.commit()
+    if result.rowcount != 1:
+        return None
+    db.session.refresh(candidate)
+    return candidate
+
+
+def run_job(claimed, metrics=None):
+    """Execute a claimed job, then mark it done or schedule a retry."""
+    queue_latency = (claimed.started_at - claimed.run_at).total_seconds()
+    started = time.perf_counter()
+    handler = _handlers.get(claimed.name)
+
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for job '{claimed.name}'")
+        handler(**claimed.payload)
+
+        # The handler's changes and the 'done' mark commit together, so a
+        # job whose effects were persisted is never run a second time. A
+        # failing commit is handled like a failing handler.
+        claimed.status = 'done'
+        claimed.finished_at = datetime.utcnow()
+        claimed.last_error = None
+        db.session.commit()
+    except Exception as exc:
+        db.session.rollback()
+        run_time = time.perf_counter() - started
+        outcome = _record_failure(claimed, exc)
+        logger.warning("job id=%s name=%s attempt=%d %s: %s",
+                       claimed.id, claimed.name, claimed.attempts, outcome, exc)
+    else:
+        run_time = time.perf_counter() - started
+        outcome = 'done'
+
+    if metrics is not None:
+        metrics.observe(claimed.name, queue_latency, run_time, outcome)
+    return outcome
+
+
+def _record_failure(claimed, exc):
+    """Persist the error and either requeue with backoff or give up."""
+    claimed.last_error = f"{type(exc).__name__}: {exc}"
+    if claimed.attempts >= claimed.max_attempts:
+        claimed.status = 'failed'
+        claimed.finished_at = datetime.utcnow()
+        outcome = 'failed'
+    else:
+        delay = min(BACKOFF_BASE * 2 ** (claimed.attempts - 1), BACKOFF_MAX)
+        claimed.status = 'queued'
+        claimed.run_at = datetime.utcnow() + timedelta(seconds=delay)
+        outcome = 'retried'
+    db.session.commit()
+    return outcome
+
+
+def requeue_stale(timeout):
+    """
+    Return jobs stuck in 'running' for more than `timeout` seconds to the queue.
+
+    A stuck job already used its attempt when it was claimed, so jobs that are
+    out of attempts (e.g. one that keeps killing its worker) are marked
+    'failed' instead of being retried forever.
+
+    Returns:
+        int: Number of jobs requeued or failed.
+    """
+    now = datetime.utcnow()
+    stale = (Job.status == 'running', Job.started_at < now - timedelta(seconds=timeout))
+    failed = db.session.execute(
+        update(Job)
+        .where(*stale, Job.attempts >= Job.max_attempts)
+        .values(status='failed', finished_at=now, last_error='Abandoned by its worker')
+    )
+    requeued = db.session.execute(
+        update(Job)
+        .where(*stale)
+        .values(status='queued', run_at=now)
+    )
+    db.session.commit()
+    return failed.rowcount + requeued.rowcount
+
+
+def purge_finished(older_than_days):
+    """Delete done/failed jobs finished more than `older_than_days` ago."""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    result = db.session.execute(
+        delete(Job).where(Job.status.in_(('done', 'failed')), Job.finished_at < cutoff)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+# -----------------------------------------------------------------------------
+# Worker
+# -----------------------------------------------------------------------------
+
+def _work_loop(app, stop, poll_interval, metrics):
+    """Claim and run jobs until `stop` is set. Runs in its own app context."""
+    with app.app_context():
+        while not stop.is_set():
+            try:
+                claimed = claim_next()
+            except Exception:
+                logger.exception("Failed to claim a job")
+                db.session.rollback()
+                stop.wait(poll_interval)
+                continue
+
+            if claimed is None:
+                stop.wait(poll_interval)
+                continue
+
+            job_id = claimed.id
+            try:
+                run_job(claimed, metrics)
+            except Exception:
+                # e.g. the database went away while recording the outcome;
+                # the job stays 'running' until requeue_stale picks it up.
+                logger.exception("Failed to record the outcome of job id=%s", job_id)
+                db.session.rollback()
+
+
+def run_worker(app, threads=1, poll_interval=1.0, metrics_interval=60.0):
+    """
+    Run `threads` worker threads in this process until SIGINT/SIGTERM.
+
+    Args:
+        app (Flask): Application whose database holds the queue.
+        threads (int): Number of concurrent worker threads.
+        poll_interval (float): Seconds to sleep when the queue is empty.
+        metrics_interval (float): Seconds between metric log lines.
+    """
+    stop = threading.Event()
+    metrics = JobMetrics()
+
+    def _shutdown(signum, frame):
+        stop.set()
+
+    signal.signal(signal.SIGINT, _shutdown)
+    signal.signal(signal.SIGTERM, _shutdown)
+
+    workers = [
+        threading.Thread(target=_work_loop, args=(app, stop, poll_interval, metrics),
+                         name=f"jobs-worker-{i}", daemon=True)
+        for i in range(threads)
+    ]
+    for w in workers:
+        w.start()
+
+    logger.info("Job worker pid=%d started with %d thread(s)", os.getpid(), threads)
+    while not stop.wait(metrics_interval):
+        metrics.log()
+
+    for w in workers:
+        w.join()
+    metrics.log()
+
+
+def _process_main(threads, poll_interval, metrics_interval, log_level):
+    """Entry point of a child worker process: builds its own app, engine and logging."""
+    from wamini_package.app import create_app
+
+    # Spawned children start from a fresh interpreter without the parent's logging setup
+    logging.basicConfig(level=log_level)
+    run_worker(create_app(), threads, poll_interval, metrics_interval)
+
+
+# -----------------------------------------------------------------------------
+# Job handlers
+# -----------------------------------------------------------------------------
+
+@job("negotiation.message_sent")
+def notify_message_sent(message_id):
+    """Notify the other participants of a negotiation about a new message."""
+    message = db.session.get(Message, message_id)
+    if message is None:
+        return
+
+    recipients = set(repository.participant_ids(message.negotiation_id))
+    recipients.discard(message.sender_id)
+
+    # No push provider is configured yet; the notification is only logged.
+    for user_id in sorted(recipients):
+        logger.info("notify user_id=%s negotiation_id=%s message_id=%s",
+                    user_id, message.negotiation_id, message.id)
+
+
+@job("jobs.cleanup")
+def cleanup_jobs(older_than_days=7, stale_timeout=900):
+    """Purge old finished jobs and requeue jobs abandoned by dead workers."""
+    requeue_stale(stale_timeout)
+    purge_finished(older_than_days)
+
+
+# -----------------------------------------------------------------------------
+# CLI
+# -----------------------------------------------------------------------------
+
+jobs_cli = AppGroup("jobs", help="Manage the background job queue.")
+
+
+@jobs_cli.command("work")
+@click.option("--processes", default=1, show_default=True, envvar="JOBS_PROCESSES",
+              help="Number of worker processes.")
+@click.option("--threads", default=4, show_default=True, envvar="JOBS_THREADS",
+              help="Worker threads per process.")
+@click.option("--poll-interval", default=1.0, show_default=True,
+              help="Seconds to sleep when the queue is empty.")
+@click.option("--metrics-interval", default=60.0, show_default=True,
+              help="Seconds between job metric log lines.")
+def work_command(processes, threads, poll_interval, metrics_interval):
+    """Run job workers until interrupted."""
+    logging.basicConfig(level=logging.INFO)
+
+    if processes <= 1:
+        run_worker(current_app._get_current_object(), threads, poll_interval, metrics_interval)
+        return
+
+    # Children build their own app so no engine or connection crosses a fork.
+    ctx = multiprocessing.get_context("spawn")
+    children = [
+        ctx.Process(target=_process_main,
+                    args=(threads, poll_interval, metrics_interval, logging.getLogger().level))
+        for _ in range(processes)
+    ]
+
+    def _shutdown(signum, frame):
+        # Children stop claiming and finish their running jobs on SIGTERM
+        for child in children:
+            if child.is_alive():
+                child.terminate()
+
+    signal.signal(signal.SIGINT, _shutdown)
+    signal.signal(signal.SIGTERM, _shutdown)
+
+    for child in children:
+        child.start()
+    for child in children:
+        child.join()
+
+
+@jobs_cli.command("cleanup")
+@click.option("--older-than-days", default=7, show_default=True,
+              help="Delete finished jobs older than this.")
+@click.option("--stale-timeout", default=900, show_default=True,
+              help="Requeue jobs running for longer than this many seconds.")
+def cleanup_command(older_than_days, stale_timeout):
+    """Purge finished jobs and requeue (or fail) stale ones."""
+    requeued = requeue_stale(stale_timeout)
+    purged = purge_finished(older_than_days)
+    click.echo(f"Requeued or failed {requeued} stale job(s), purged {purged} finished job(s).")
+
+
+@jobs_cli.command("stats")
+def stats_command():
+    """Show queue depth per status and the age of the oldest runnable job."""
+    rows = db.session.execute(
+        select(Job.status, func.count(Job.id)).group_by(Job.status)
+    ).all()
+    for status, count in sorted(rows):
+        click.echo(f"{status}: {count}")
+
+    oldest = db.session.execute(
+        select(func.min(Job.run_at)).where(Job.status == 'queued', Job.run_at <= datetime.utcnow())
+    ).scalar()
+    if oldest is not None:
+        click.echo(f"oldest runnable job waiting: {(datetime.utcnow() - oldest).total_seconds():.1f}s")
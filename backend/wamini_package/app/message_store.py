@@ -0,0 +1,265 @@
+"""
+message_store.py
+----------
+Storage lifecycle of negotiation messages.
+
+Hot storage:
+    On PostgreSQL the ``messages`` table is range-partitioned by ``timestamp``
+    month. Queries for one thread are bounded below by the negotiation's
+    creation time (see ``thread_filter``) so the planner only visits the
+    partitions the thread can live in, and vacuum/index maintenance works on
+    one month at a time. ``flask messages partitions`` creates upcoming month
+    partitions ahead of time; rows outside them land in ``messages_default``.
+    If a run was missed and the default partition already holds rows of a
+    month, those rows are moved into the new month partition as it is created.
+
+Cold storage:
+    Once a negotiation has been closed for a while, ``flask messages archive``
+    moves its messages into a gzip-compressed JSON-lines file under
+    ``MESSAGE_ARCHIVE_DIR`` and deletes them from the table. Archived threads
+    are still served by ``get_messages``, read back from the file on demand.
+
+    The files are then the only copy of those messages, so
+    ``MESSAGE_ARCHIVE_DIR`` must be storage every server reads and that
+    survives redeploys (a network volume or mounted bucket), never a local
+    or temporary disk. Archiving refuses to run when it is not set, and a
+    thread whose file cannot be found raises ``ArchiveUnavailable`` instead
+    of reading as empty.
+"""
+
+import gzip
+import json
+import os
+from datetime import date, datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, select, text
+
+from .models import db, Message, Negotiation
+
+# Margin applied to the thread lower bound, so timestamps written with a
+# different session time zone than `created_at` are never cut off.
+_BOUND_MARGIN = timedelta(days=1)
+
+
+def thread_floor(negotiation):
+    """Earliest timestamp a message of `negotiation` can have."""
+    if negotiation.created_at is None:
+        return datetime.min
+    return negotiation.created_at - _BOUND_MARGIN
+
+
+def thread_filter(negotiation):
+    """
+    Conditions selecting the messages of `negotiation`.
+
+    The timestamp bound lets PostgreSQL prune partitions older than the thread.
+    """
+    return [
+        Message.negotiation_id == negotiation.id,
+        Message.timestamp >= thread_floor(negotiation),
+    ]
+
+
+# -----------------------------------------------------------------------------
+# Partitions
+# -----------------------------------------------------------------------------
+
+def _is_partitioned():
+    if db.engine.dialect.name != "postgresql":
+        return False
+    return db.session.execute(text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('messages')"
+    )).first() is not None
+
+
+DEFAULT_PARTITION = "messages_default"
+
+
+def _create_partition(name, start, end):
+    """
+    Create the partition `name` for [start, end).
+
+    PostgreSQL refuses to create a partition while the default partition
+    holds rows of its range. In that case the default partition is detached,
+    the new partition is created, the rows are moved into it and the default
+    partition is attached again, all in the caller's transaction.
+    """
+    bounds = {"start": start, "end": end}
+    create = text(
+        f"CREATE TABLE {name} PARTITION OF messages "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    )
+    has_default = db.session.execute(
+        text("SELECT to_regclass(:name)"), {"name": DEFAULT_PARTITION}
+    ).scalar()
+    stray = has_default and db.session.execute(text(
+        f"SELECT 1 FROM {DEFAULT_PARTITION} WHERE timestamp >= :start AND timestamp < :end LIMIT 1"
+    ), bounds).first()
+
+    if not stray:
+        db.session.execute(create)
+        return 0
+
+    db.session.execute(text(f"ALTER TABLE messages DETACH PARTITION {DEFAULT_PARTITION}"))
+    db.session.execute(create)
+    moved = db.session.execute(text(
+        f"INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} "
+        f"WHERE timestamp >= :start AND timestamp < :end"
+    ), bounds).rowcount
+    db.session.execute(text(
+        f"DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= :start AND timestamp < :end"
+    ), bounds)
+    db.session.execute(text(f"ALTER TABLE messages ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+    return moved
+
+
+def _month_start(day, offset=0):
+    month = day.month - 1 + offset
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def ensure_partitions(months_ahead=3):
+    """
+    Create monthly partitions from the current month to `months_ahead` months out.
+
+    Returns:
+        list[str]: Names of the partitions that were created.
+    """
+    if not _is_partitioned():
+        return []
+
+    created = []
+    today = date.today()
+    for offset in range(months_ahead + 1):
+        start = _month_start(today, offset)
+        end = _month_start(today, offset + 1)
+        name = f"messages_y{start.year}m{start.month:02d}"
+        exists = db.session.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar()
+        if exists:
+            continue
+        moved = _create_partition(name, start, end)
+        if moved:
+            current_app.logger.warning(
+                "Moved %d message(s) from %s into %s", moved, DEFAULT_PARTITION, name)
+        created.append(name)
+        # One transaction per month keeps the lock on messages short
+        db.session.commit()
+    return created
+
+
+# -----------------------------------------------------------------------------
+# Archive
+# -----------------------------------------------------------------------------
+
+class ArchiveUnavailable(RuntimeError):
+    """The archive of a negotiation cannot be read (or written)."""
+
+
+def archive_path(negotiation_id):
+    directory = current_app.config.get("MESSAGE_ARCHIVE_DIR")
+    if not directory:
+        raise ArchiveUnavailable("MESSAGE_ARCHIVE_DIR is not set")
+    return os.path.join(directory, f"negotiation_{negotiation_id}.jsonl.gz")
+
+
+def _serialize(message):
+    return {
+        "id": message.id,
+        "sender_id": message.sender_id,
+        "body": message.body,
+        "timestamp": message.timestamp.isoformat()
+    }
+
+
+def archive_negotiation(negotiation):
+    """
+    Move the messages of a closed negotiation to its archive file.
+
+    The file is fully written and synced before the rows are deleted, so a
+    crash at any point leaves the messages readable from one of the two places.
+
+    Returns:
+        int: Number of messages archived.
+    """
+    messages = db.session.execute(
+        select(Message).where(*thread_filter(negotiation)).order_by(Message.timestamp.asc())
+    ).scalars().all()
+
+    path = archive_path(negotiation.id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        for message in messages:
+            f.write(json.dumps(_serialize(message)) + "\n")
+    with open(tmp_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    db.session.execute(delete(Message).where(*thread_filter(negotiation)))
+    negotiation.archived_at = datetime.utcnow()
+    db.session.commit()
+    return len(messages)
+
+
+def read_archived_messages(negotiation_id):
+    """
+    Return the archived messages of a negotiation, oldest first.
+
+    Raises:
+        ArchiveUnavailable: The archive file is missing, e.g. because
+            ``MESSAGE_ARCHIVE_DIR`` is not the storage it was written to.
+    """
+    path = archive_path(negotiation_id)
+    if not os.path.exists(path):
+        raise ArchiveUnavailable(f"Archive of negotiation {negotiation_id} not found at {path}")
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def archive_closed(closed_days=30, limit=500):
+    """Archive up to `limit` negotiations closed more than `closed_days` ago."""
+    cutoff = datetime.utcnow() - timedelta(days=closed_days)
+    negotiations = db.session.execute(
+        select(Negotiation)
+        .where(Negotiation.closed_at < cutoff, Negotiation.archived_at.is_(None))
+        .order_by(Negotiation.closed_at)
+        .limit(limit)
+    ).scalars().all()
+
+    archived = 0
+    for negotiation in negotiations:
+        archived += archive_negotiation(negotiation)
+    return len(negotiations), archived
+
+
+# -----------------------------------------------------------------------------
+# CLI
+# -----------------------------------------------------------------------------
+
+messages_cli = AppGroup("messages", help="Maintain message partitions and archives.")
+
+
+@messages_cli.command("partitions")
+@click.option("--months-ahead", default=3, show_default=True,
+              help="Create partitions up to this many months ahead.")
+def partitions_command(months_ahead):
+    """Create upcoming monthly partitions of the messages table."""
+    created = ensure_partitions(months_ahead)
+    click.echo(f"Created {len(created)} partition(s): {', '.join(created) or '-'}")
+
+
+@messages_cli.command("archive")
+@click.option("--closed-days", default=30, show_default=True,
+              help="Archive negotiations closed more than this many days ago.")
+@click.option("--limit", default=500, show_default=True,
+              help="Maximum number of negotiations archived per run.")
+def archive_command(closed_days, limit):
+    """Move messages of closed negotiations into compressed archive files."""
+    if not current_app.config.get("MESSAGE_ARCHIVE_DIR"):
+        raise click.ClickException(
+            "MESSAGE_ARCHIVE_DIR must be set to shared, durable storage before archiving.")
+    negotiations, messages = archive_closed(closed_days, limit)
+    click.echo(f"Archived {messages} message(s) from {negotiations} negotiation(s).")
@@ -9,6 +9,11 @@ It includes the following main entities:
 - Input: Represents agricultural inputs (e.g., fertilizers, seeds).
 - Transport: Represents transport services offered by users.
 - Negotiation: Represents communication or message exchanges between users.
+- Job: Represents a unit of background work queued outside the request path.
+- PriceRollup: Pre-aggregated price statistics per item name, region and period.
+- IdempotencyKey: Stored responses of write requests, replayed on client retries.
+- SyncCounter: Monotonic change counter behind the catalog sync tokens.
+- NegotiationParticipant: Membership of users in negotiations, ordered by activity.
 
 Each model includes relationship mappings to maintain referential integrity.
 """
@@ -70,6 +75,10 @@ class Product(db.Model):
         price (float): Unit price.
         publish_date (datetime): Date and time of product publication.
         photo (str): Optional product image (path or URL).
+        updated_at (datetime): Timestamp of the last change.
+        deleted_at (datetime): Soft-delete tombstone; set instead of deleting the row.
+        change_seq (int): Catalog change token of the last change (see sync.py).
+        rolled_up_at (datetime): When the price was counted in the price rollups.
         user_id (int): Foreign key linking to the publishing user.
     """
 
@@ -81,6 +90,10 @@ class Product(db.Model):
     price = db.Column(db.Float, nullable=False)
     publish_date = db.Column(db.DateTime, default=datetime.utcnow)
     photo = db.Column(db.String(255))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    deleted_at = db.Column(db.DateTime)
+    change_seq = db.Column(db.BigInteger, index=True)
+    rolled_up_at = db.Column(db.DateTime)
 
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
 
@@ -99,6 +112,10 @@ class Input(db.Model):
         price (float): Unit price.
         publish_date (datetime): Date and time of publication.
         photo (str): Optional input image (path or URL).
+        updated_at (datetime): Timestamp of the last change.
+        deleted_at (datetime): Soft-delete tombstone; set instead of deleting the row.
+        change_seq (int): Catalog change token of the last change (see sync.py).
+        rolled_up_at (datetime): When the price was counted in the price rollups.
         user_id (int): Foreign key linking to the publishing user.
     """
 
@@ -110,6 +127,10 @@ class Input(db.Model):
     price = db.Column(db.Float, nullable=False)
     publish_date = db.Column(db.DateTime, default=datetime.utcnow)
     photo = db.Column(db.String(255))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    deleted_at = db.Column(db.DateTime)
+    change_seq = db.Column(db.BigInteger, index=True)
+    rolled_up_at = db.Column(db.DateTime)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
 
 
@@ -123,8 +144,14 @@ class Transport(db.Model):
         transport_type (str): Vehicle type (e.g., Moto Bike, Mini Truck, Truck).
         name (str): Vehicle or service name.
         price_per_km (float): Price charged per kilometer.
+        latitude (float): Latitude of the vehicle's base, used for pickup distance.
+        longitude (float): Longitude of the vehicle's base.
+        capacity_kg (float): Maximum cargo in kilograms (NULL when not stated).
         publish_date (datetime): Date and time of publication.
         photo (str): Optional vehicle image (path or URL).
+        updated_at (datetime): Timestamp of the last change.
+        deleted_at (datetime): Soft-delete tombstone; set instead of deleting the row.
+        change_seq (int): Catalog change token of the last change (see sync.py).
         user_id (int): Foreign key linking to the publishing user.
     """
 
@@ -134,8 +161,14 @@ class Transport(db.Model):
     transport_type = db.Column(db.String(50), nullable=False)
     name = db.Column(db.String(120), nullable=False)
     price_per_km = db.Column(db.Float, nullable=False)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    capacity_kg = db.Column(db.Float)
     publish_date = db.Column(db.DateTime, default=datetime.utcnow)
     photo = db.Column(db.String(255))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    deleted_at = db.Column(db.DateTime)
+    change_seq = db.Column(db.BigInteger, index=True)
 
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
 
@@ -151,6 +184,8 @@ class Negotiation(db.Model):
         messages (JSON): List of messages exchanged, formatted as:
                          [{'from': <user_id>, 'body': <text>, 'att': <optional_attachment>}].
         created_at (datetime): Timestamp of creation.
+        closed_at (datetime): Timestamp at which the negotiation was closed, if any.
+        archived_at (datetime): Timestamp at which its messages were moved to cold storage.
         user_id (int): The ID of the user initiating the negotiation.
         product_id (int): Optional link to a Product under discussion.
         input_id (int): Optional link to an Input under discussion.
@@ -162,6 +197,8 @@ class Negotiation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     messages = db.Column(db.JSON, nullable=False, default=list)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    closed_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime)
 
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'))
@@ -206,19 +243,205 @@ class Message(db.Model):
     Notes
     -----
     - `timestamp` is timezone-aware (UTC) for consistency across deployments.
+    - On PostgreSQL the table is range-partitioned by `timestamp` month (see
+      migration 'partition messages by month'); the database primary key is
+      therefore (id, timestamp), while `id` alone stays unique.
+    - Messages of archived negotiations live in compressed files instead of
+      this table (see `message_store.py`).
     - Cascade deletion ensures that messages are removed when their negotiation
       is deleted, maintaining referential integrity.
     """
 
     __tablename__ = 'messages'
+    __table_args__ = (
+        db.Index('ix_messages_negotiation_id_timestamp', 'negotiation_id', 'timestamp'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     negotiation_id = db.Column(db.Integer, db.ForeignKey('negotiations.id'), nullable=False)
     body = db.Column(db.Text, nullable=False)
-    timestamp = db.Column(db.DateTime, default=lambda: datetime.now(datetime.utcnow))
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     sender = db.relationship('User', backref='messages')
 
     def __repr__(self):
         """Return a string representation for debugging."""
         return f"<Message id={self.id} from={self.sender_id} negotiation={self.negotiation_id}>"
+
+
+
+class Job(db.Model):
+    """
+    Represents a unit of background work queued by a request handler.
+
+    Jobs are written in the same transaction as the change that triggered them
+    and are executed later by the worker started with ``flask jobs work``.
+
+    Attributes:
+        id (int): Primary key identifier.
+        name (str): Registered handler name (e.g., 'negotiation.message_sent').
+        payload (JSON): Keyword arguments passed to the handler.
+        status (str): One of 'queued', 'running', 'done' or 'failed'.
+        attempts (int): Number of times the job has been claimed.
+        max_attempts (int): Attempts allowed before the job is marked 'failed'.
+        last_error (str): Error raised by the latest failed attempt, if any.
+        run_at (datetime): Earliest time the job may run (pushed back on retry).
+        created_at (datetime): Timestamp of enqueueing.
+        started_at (datetime): Timestamp of the latest claim.
+        finished_at (datetime): Timestamp of completion or final failure.
+    """
+
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    last_error = db.Column(db.Text)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"<Job id={self.id} name={self.name!r} status={self.status}>"
+
+
+class PriceRollup(db.Model):
+    """
+    Pre-aggregated price statistics for one item, region and time bucket.
+
+    Rows are maintained incrementally when listings are published and can be
+    rebuilt from the raw tables with ``flask analytics rebuild``.
+
+    Attributes:
+        id (int): Primary key identifier.
+        kind (str): Listing type, 'product' or 'input'.
+        name_key (str): Normalized item name (lower-case, single-spaced).
+        region (str): Normalized publisher localization ('' when unknown).
+        bucket (str): Bucket size, 'day' or 'week'.
+        bucket_start (date): First day of the bucket (weeks start on Monday).
+        sample_count (int): Number of listings aggregated.
+        price_total (float): Sum of listing prices, used to derive the average.
+        price_min (float): Lowest listing price.
+        price_max (float): Highest listing price.
+    """
+
+    __tablename__ = 'price_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('kind', 'name_key', 'bucket', 'region', 'bucket_start',
+                            name='uq_price_rollups_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    name_key = db.Column(db.String(120), nullable=False)
+    region = db.Column(db.String(255), nullable=False, default='')
+    bucket = db.Column(db.String(10), nullable=False)
+    bucket_start = db.Column(db.Date, nullable=False)
+    sample_count = db.Column(db.Integer, nullable=False, default=0)
+    price_total = db.Column(db.Float, nullable=False, default=0.0)
+    price_min = db.Column(db.Float, nullable=False)
+    price_max = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return (f"<PriceRollup {self.kind}:{self.name_key!r} region={self.region!r} "
+                f"{self.bucket}={self.bucket_start}>")
+
+
+class IdempotencyKey(db.Model):
+    """
+    Represents an `Idempotency-Key` sent with a write request and its response.
+
+    The row is added to the request's own transaction before the route runs,
+    so it is committed together with the route's changes, still without a
+    response; the response is stored by a second commit once the route
+    returns. A row left in flight longer than IDEMPOTENCY_IN_FLIGHT_TIMEOUT
+    (e.g. after a crash between the two commits) can be reclaimed by a retry.
+
+    Attributes:
+        id (int): Primary key identifier.
+        key (str): Client-supplied idempotency key.
+        scope (str): Caller and route the key belongs to ('<user>:<method> <path>').
+        request_hash (str): SHA-256 of the request body, to reject key reuse.
+        status_code (int): Stored response status; NULL while the request is in flight.
+        response_body (JSON): Stored JSON response body.
+        created_at (datetime): Timestamp of the first request.
+        expires_at (datetime): Time after which the key may be reused.
+    """
+
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.UniqueConstraint('scope', 'key', name='uq_idempotency_keys_scope_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(255), nullable=False)
+    scope = db.Column(db.String(255), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer)
+    response_body = db.Column(db.JSON)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<IdempotencyKey key={self.key!r} scope={self.scope!r} status={self.status_code}>"
+
+
+class SyncCounter(db.Model):
+    """
+    A named monotonic counter.
+
+    'catalog' hands out catalog change tokens: incrementing the row locks it
+    until the writing transaction commits, so tokens become visible in the
+    same order they were assigned. The 'rollups' row is only locked, to keep
+    price rollup jobs and rebuilds apart (see analytics.py).
+
+    Attributes:
+        name (str): Counter name (primary key), e.g. 'catalog'.
+        value (int): Last token handed out.
+    """
+
+    __tablename__ = 'sync_counters'
+
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<SyncCounter {self.name}={self.value}>"
+
+
+class NegotiationParticipant(db.Model):
+    """
+    Represents a user taking part in a negotiation.
+
+    Both sides of a deal get a row: the initiator and the owner of the listing
+    under discussion. The (user_id, last_activity, negotiation_id) index serves
+    a user's inbox, most recent first and paged with the (last_activity,
+    negotiation_id) cursor, as one index range scan; the primary key answers
+    membership checks.
+
+    Attributes:
+        negotiation_id (int): Foreign key to the negotiation (part of the primary key).
+        user_id (int): Foreign key to the participating user (part of the primary key).
+        role (str): 'initiator' or 'owner'.
+        last_activity (datetime): Time of the latest message (or of the start).
+    """
+
+    __tablename__ = 'negotiation_participants'
+    __table_args__ = (
+        db.Index('ix_negotiation_participants_user_activity', 'user_id', 'last_activity', 'negotiation_id'),
+    )
+
+    negotiation_id = db.Column(db.Integer, db.ForeignKey('negotiations.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    role = db.Column(db.String(20), nullable=False)
+    last_activity = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<NegotiationParticipant negotiation={self.negotiation_id} user={self.user_id} role={self.role}>"
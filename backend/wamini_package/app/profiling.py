@@ -0,0 +1,275 @@
+"""
+profiling.py
+----------
+Opt-in, on-demand profiling of live requests.
+
+When ``PROFILING_ENABLED`` is set, ``create_app`` calls ``init_profiling``,
+which installs request hooks and SQLAlchemy cursor events. Nothing is
+installed otherwise, so a disabled profiler costs nothing.
+
+A request is profiled when either:
+    - it is picked by random sampling (``PROFILE_SAMPLE_RATE``, 0.0-1.0), or
+    - it carries a valid ``X-Wamini-Profile`` header, a signed token minted
+      with ``flask profiling token`` (expires after ``PROFILE_TOKEN_MAX_AGE``).
+
+For a profiled request a background thread samples the request thread's
+stack every ``PROFILE_INTERVAL_MS`` milliseconds. While a SQL statement runs
+it is appended to the sampled stack as an ``[sql] ...`` frame, so database
+time shows up in the flame graph next to the code that issued it.
+
+Output, under ``PROFILE_DIR`` (size-rotated):
+    - ``<endpoint>.folded``: collapsed stacks ("frame;frame;... count"),
+      ready for flamegraph.pl or speedscope.
+    - ``requests.jsonl``: one line per profiled request with its duration,
+      sample count and every SQL statement with its timing.
+
+Cost is bounded: at most ``MAX_CONCURRENT`` requests are profiled at once and
+at most ``MAX_SQL_STATEMENTS`` statements are recorded per request.
+"""
+
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from logging.handlers import RotatingFileHandler
+
+import click
+from flask import current_app, g, request
+from flask.cli import AppGroup
+from itsdangerous import BadSignature, TimestampSigner
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+HEADER = "X-Wamini-Profile"
+UNMATCHED_ENDPOINT = "<unmatched>"
+TOKEN_SALT = "wamini-profile"
+
+MAX_CONCURRENT = 4
+MAX_SQL_STATEMENTS = 200
+MAX_SQL_LENGTH = 300
+FILE_MAX_BYTES = 10 * 1024 * 1024
+FILE_BACKUP_COUNT = 5
+
+# Requests currently being profiled, keyed by thread ident
+_active = {}
+_active_lock = threading.Lock()
+
+
+class ProfiledRequest:
+    """Samples and SQL timings collected for one request."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.stacks = Counter()
+        self.statements = []
+        self.current_sql = None
+        self.sql_started = None
+
+
+def _clean(text):
+    """Make a frame name safe for the collapsed-stack format."""
+    return " ".join(text.replace(";", ",").split())
+
+
+class StackSampler:
+    """Background thread sampling the stacks of the profiled request threads."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._thread = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def wake(self):
+        """Start the sampling thread if needed and resume sampling."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            with _active_lock:
+                if not _active:
+                    self._wake.clear()
+                targets = list(_active.items())
+            if not targets:
+                # Idle until the next profiled request instead of polling
+                self._wake.wait()
+                continue
+
+            time.sleep(self.interval)
+
+            frames = sys._current_frames()
+            for thread_id, profiled in targets:
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(profiled.endpoint)
+                stack.reverse()
+                sql = profiled.current_sql
+                if sql is not None:
+                    stack.append(f"[sql] {sql}")
+                profiled.stacks[";".join(_clean(f) for f in stack)] += 1
+
+
+# -----------------------------------------------------------------------------
+# Output
+# -----------------------------------------------------------------------------
+
+class ProfileWriter:
+    """Size-rotated output files, one collapsed-stack file per endpoint."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._handlers = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _handler(self, filename):
+        with self._lock:
+            handler = self._handlers.get(filename)
+            if handler is None:
+                handler = RotatingFileHandler(
+                    os.path.join(self.directory, filename),
+                    maxBytes=FILE_MAX_BYTES, backupCount=FILE_BACKUP_COUNT, delay=True
+                )
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                self._handlers[filename] = handler
+            return handler
+
+    def _write(self, filename, message):
+        # handle() takes the handler's lock, so concurrent teardowns cannot
+        # write while another thread rolls the file over
+        self._handler(filename).handle(logging.makeLogRecord({"msg": message}))
+
+    def write(self, endpoint, stacks, summary):
+        if stacks:
+            folded = "\n".join(f"{stack} {count}" for stack, count in stacks.items())
+            self._write(f"{_clean(endpoint).replace('/', '_')}.folded", folded)
+        self._write("requests.jsonl", json.dumps(summary))
+
+
+# -----------------------------------------------------------------------------
+# Request selection
+# -----------------------------------------------------------------------------
+
+def _signer(app):
+    return TimestampSigner(app.config["SECRET_KEY"], salt=TOKEN_SALT)
+
+
+def make_token(app):
+    """Mint a token that forces profiling of requests sending it in `HEADER`."""
+    return _signer(app).sign("profile").decode()
+
+
+def _header_requests_profile(app):
+    token = request.headers.get(HEADER)
+    if not token or not app.config.get("SECRET_KEY"):
+        return False
+    try:
+        _signer(app).unsign(token, max_age=app.config["PROFILE_TOKEN_MAX_AGE"])
+    except BadSignature:
+        return False
+    return True
+
+
+# -----------------------------------------------------------------------------
+# Hooks
+# -----------------------------------------------------------------------------
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profiled = _active.get(threading.get_ident())
+    if profiled is not None:
+        profiled.current_sql = statement[:MAX_SQL_LENGTH]
+        profiled.sql_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profiled = _active.get(threading.get_ident())
+    if profiled is not None and profiled.sql_started is not None:
+        if len(profiled.statements) < MAX_SQL_STATEMENTS:
+            profiled.statements.append({
+                "statement": profiled.current_sql,
+                "duration_ms": round((time.perf_counter() - profiled.sql_started) * 1000, 3)
+            })
+        profiled.current_sql = None
+        profiled.sql_started = None
+
+
+def init_profiling(app):
+    """Install the profiling hooks on `app`. Only called when profiling is enabled."""
+    sampler = StackSampler(app.config["PROFILE_INTERVAL_MS"] / 1000)
+    writer = ProfileWriter(app.config["PROFILE_DIR"])
+    sample_rate = app.config["PROFILE_SAMPLE_RATE"]
+
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+    @app.before_request
+    def start_profile():
+        if len(_active) >= MAX_CONCURRENT:
+            return
+        if not (random.random() < sample_rate or _header_requests_profile(app)):
+            return
+
+        # Unmatched paths share one name, so scans cannot create a file per path
+        profiled = ProfiledRequest(request.endpoint or UNMATCHED_ENDPOINT)
+        with _active_lock:
+            if len(_active) >= MAX_CONCURRENT:
+                return
+            _active[threading.get_ident()] = profiled
+        g.profiled_request = profiled
+        sampler.wake()
+
+    @app.after_request
+    def record_status(response):
+        if "profiled_request" in g:
+            g.profiled_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def finish_profile(exc):
+        profiled = g.pop("profiled_request", None)
+        if profiled is None:
+            return
+        with _active_lock:
+            _active.pop(threading.get_ident(), None)
+
+        # The sampler may still be adding the sample it took before the pop
+        stacks = dict(profiled.stacks)
+        writer.write(profiled.endpoint, stacks, {
+            "endpoint": profiled.endpoint,
+            "method": request.method,
+            "path": request.path,
+            "status": g.pop("profiled_status", 500 if exc else None),
+            "duration_ms": round((time.perf_counter() - profiled.started) * 1000, 3),
+            "samples": sum(stacks.values()),
+            "sql": profiled.statements,
+        })
+
+
+# -----------------------------------------------------------------------------
+# CLI
+# -----------------------------------------------------------------------------
+
+profiling_cli = AppGroup("profiling", help="On-demand request profiling.")
+
+
+@profiling_cli.command("token")
+def token_command():
+    """Print a token for the X-Wamini-Profile header."""
+    if not current_app.config.get("SECRET_KEY"):
+        raise click.ClickException("SECRET_KEY must be set to sign profiling tokens.")
+    click.echo(make_token(current_app))
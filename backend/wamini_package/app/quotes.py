@@ -0,0 +1,283 @@
+"""
+quotes.py
+----------
+Transport quotes: rank every eligible transport offer for a trip.
+
+Each worker process keeps a ``TransportSnapshot``, the quotable offers (live,
+with a base location) held as parallel NumPy arrays. A quote is then one
+index lookup for the change token (see Refresh), no listing query, and a few
+vectorized operations over those arrays with no per-offer Python code:
+
+    pickup_km = distance(vehicle base -> origin)
+    total_km  = pickup_km + trip_km       (trip_km = origin -> destination)
+    cost      = price_per_km * total_km
+
+Offers are eligible when their capacity is unknown or at least the cargo
+quantity, they match the requested ``transport_type`` and, optionally, their
+pickup distance is at most ``max_pickup_km``. The ``k`` cheapest are picked
+with ``argpartition`` and sorted by cost, then total distance.
+
+Distances are great-circle (straight line) kilometers. Vehicle bases are
+stored as unit vectors on the sphere, so a distance is the chord to the
+origin's vector turned into an arc length: no trigonometry per offer other
+than one ``arcsin``, which is several times faster than the haversine formula.
+
+Refresh:
+    Before each quote the snapshot's change token is compared with the
+    latest ``change_seq`` of the transports table (one index lookup, see
+    ``sync.catalog_version``). When a transport was added, edited or deleted
+    since, only the rows with a newer token are loaded and merged into a new
+    snapshot, which then replaces the old one. Snapshots are never modified
+    in place, so concurrent quotes keep using the one they started with.
+
+Warm-up:
+    Loading every offer takes seconds for a few hundred thousand rows, so it
+    is not left to the first quote of each worker. With ``preload_app``,
+    ``gunicorn.conf.py`` calls ``warm_snapshot`` in the master before forking:
+    every worker, including the ones recycled after ``max_requests``, starts
+    from that snapshot (shared copy-on-write) and only loads the changes made
+    since. Without preloading each worker warms its own snapshot at start-up.
+    NumPy is therefore loaded in the web processes, once, by the master.
+"""
+
+import logging
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import select
+
+from .models import db, Transport
+from .sync import catalog_version
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+
+_COLUMNS = (
+    Transport.id, Transport.name, Transport.transport_type, Transport.price_per_km,
+    Transport.latitude, Transport.longitude, Transport.capacity_kg, Transport.user_id,
+    Transport.deleted_at
+)
+
+
+class TransportSnapshot:
+    """
+    Immutable, array-backed copy of the quotable transport offers.
+
+    Attributes:
+        seq (int): Change token the snapshot is up to date with.
+        ids (ndarray[int64]): Transport ids.
+        names (ndarray[object]): Transport names.
+        type_codes (ndarray[int32]): Index of each offer's type in `type_names`.
+        type_names (tuple[str]): Transport types seen so far.
+        price (ndarray[float64]): Price per kilometer.
+        x, y, z (ndarray[float64]): Vehicle base, as a unit vector.
+        capacity (ndarray[float64]): Capacity in kg, NaN when unknown.
+        user_ids (ndarray[int64]): Owners of the offers.
+    """
+
+    def __init__(self, seq, ids, names, type_codes, type_names, price, x, y, z, capacity, user_ids):
+        self.seq = seq
+        self.ids = ids
+        self.names = names
+        self.type_codes = type_codes
+        self.type_names = type_names
+        self.price = price
+        self.x = x
+        self.y = y
+        self.z = z
+        self.capacity = capacity
+        self.user_ids = user_ids
+        for array in (ids, names, type_codes, price, x, y, z, capacity, user_ids):
+            array.setflags(write=False)
+
+    @classmethod
+    def empty(cls):
+        return cls(
+            0, np.empty(0, np.int64), np.empty(0, object), np.empty(0, np.int32), (),
+            np.empty(0), np.empty(0), np.empty(0), np.empty(0), np.empty(0), np.empty(0, np.int64)
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def merge(self, seq, rows):
+        """
+        New snapshot with `rows` (changed transports) applied.
+
+        Every changed id is dropped first; the rows that are still quotable
+        are then appended, so edits replace the old entry and deletions just
+        remove it.
+        """
+        keep = ~np.isin(self.ids, np.fromiter((row.id for row in rows), np.int64, len(rows)))
+        rows = [
+            row for row in rows
+            if row.deleted_at is None and row.latitude is not None and row.longitude is not None
+        ]
+
+        type_names = list(self.type_names)
+        codes = {name: code for code, name in enumerate(type_names)}
+        for row in rows:
+            if row.transport_type not in codes:
+                codes[row.transport_type] = len(type_names)
+                type_names.append(row.transport_type)
+
+        count = len(rows)
+        capacity = np.fromiter(
+            (np.nan if row.capacity_kg is None else row.capacity_kg for row in rows), np.float64, count
+        )
+        names = np.empty(count, object)
+        names[:] = [row.name for row in rows]
+        x, y, z = _unit_vectors(
+            np.fromiter((row.latitude for row in rows), np.float64, count),
+            np.fromiter((row.longitude for row in rows), np.float64, count)
+        )
+
+        return TransportSnapshot(
+            seq,
+            np.concatenate([self.ids[keep], np.fromiter((row.id for row in rows), np.int64, count)]),
+            np.concatenate([self.names[keep], names]),
+            np.concatenate([
+                self.type_codes[keep],
+                np.fromiter((codes[row.transport_type] for row in rows), np.int32, count)
+            ]),
+            tuple(type_names),
+            np.concatenate([self.price[keep], np.fromiter((row.price_per_km for row in rows), np.float64, count)]),
+            np.concatenate([self.x[keep], x]),
+            np.concatenate([self.y[keep], y]),
+            np.concatenate([self.z[keep], z]),
+            np.concatenate([self.capacity[keep], capacity]),
+            np.concatenate([self.user_ids[keep], np.fromiter((row.user_id for row in rows), np.int64, count)]),
+        )
+
+
+_snapshot = TransportSnapshot.empty()
+_refresh_lock = threading.Lock()
+
+
+def current_snapshot():
+    """Snapshot of the transport offers, refreshed with any newer change first."""
+    global _snapshot
+
+    version = catalog_version(Transport)
+    if version <= _snapshot.seq:
+        return _snapshot
+
+    with _refresh_lock:
+        snapshot = _snapshot
+        if version > snapshot.seq:
+            if snapshot.seq == 0:
+                query = select(*_COLUMNS).where(Transport.deleted_at.is_(None))
+            else:
+                # Rows committed after `version` was read may be loaded here
+                # too; the next refresh loads them again, which is harmless.
+                query = select(*_COLUMNS).where(Transport.change_seq > snapshot.seq)
+            _snapshot = snapshot.merge(version, db.session.execute(query).all())
+        return _snapshot
+
+
+def warm_snapshot(app):
+    """
+    Load the snapshot ahead of the first quote (server start-up hook).
+
+    Failures are only logged, so a database that is unreachable or not yet
+    migrated does not stop the server; the first quote then loads it.
+    """
+    started = time.perf_counter()
+    with app.app_context():
+        try:
+            snapshot = current_snapshot()
+        except Exception:
+            logger.exception("Could not preload the transport snapshot")
+            return
+        finally:
+            db.session.remove()
+    logger.info("Loaded %d transport offer(s) in %.2fs", len(snapshot), time.perf_counter() - started)
+
+
+def _unit_vectors(latitude, longitude):
+    """(x, y, z) on the unit sphere of points given in degrees, scalars or arrays."""
+    lat = np.radians(latitude)
+    lon = np.radians(longitude)
+    return np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)
+
+
+def _distances_km(snapshot, point):
+    """Great-circle distance in km from every offer of `snapshot` to `point` (x, y, z)."""
+    x, y, z = point
+    chord = np.square(snapshot.x - x)
+    chord += np.square(snapshot.y - y)
+    chord += np.square(snapshot.z - z)
+    np.sqrt(chord, out=chord)
+    # arc = 2 * arcsin(chord / 2), clipped against rounding just above 1
+    chord *= 0.5
+    np.minimum(chord, 1.0, out=chord)
+    np.arcsin(chord, out=chord)
+    chord *= 2 * EARTH_RADIUS_KM
+    return chord
+
+
+def quote(origin, destination, quantity, k=10, transport_type=None, max_pickup_km=None):
+    """
+    Cheapest transport offers for carrying `quantity` kg from `origin` to `destination`.
+
+    Args:
+        origin, destination (tuple[float, float]): (latitude, longitude) in degrees.
+        quantity (float): Cargo in kg.
+        k (int): Maximum number of quotes.
+        transport_type (str): Only quote this type of transport.
+        max_pickup_km (float): Skip offers based further than this from `origin`.
+
+    Returns:
+        dict: 'trip_km', 'eligible' (number of matching offers) and 'quotes',
+              cheapest first.
+    """
+    snapshot = current_snapshot()
+    start = _unit_vectors(*origin)
+    end = _unit_vectors(*destination)
+    chord = min(float(np.linalg.norm(np.subtract(start, end))) / 2, 1.0)
+    trip_km = 2 * EARTH_RADIUS_KM * float(np.arcsin(chord))
+
+    empty = {"trip_km": round(trip_km, 2), "eligible": 0, "quotes": []}
+    if transport_type is not None and transport_type not in snapshot.type_names:
+        return empty
+
+    pickup_km = _distances_km(snapshot, start)
+
+    # Written as 'not below' so that NaN (unknown capacity) stays eligible
+    mask = ~(snapshot.capacity < quantity)
+    if transport_type is not None:
+        mask &= snapshot.type_codes == snapshot.type_names.index(transport_type)
+    if max_pickup_km is not None:
+        mask &= pickup_km <= max_pickup_km
+
+    candidates = np.flatnonzero(mask)
+    if len(candidates) == 0:
+        return empty
+
+    total_km = pickup_km[candidates] + trip_km
+    cost = snapshot.price[candidates] * total_km
+
+    if len(candidates) > k:
+        top = np.argpartition(cost, k - 1)[:k]
+    else:
+        top = np.arange(len(candidates))
+    top = top[np.lexsort((total_km[top], cost[top]))]
+    selected = candidates[top]
+
+    return {
+        "trip_km": round(trip_km, 2),
+        "eligible": int(len(candidates)),
+        "quotes": [{
+            "transport_id": int(snapshot.ids[i]),
+            "name": snapshot.names[i],
+            "transport_type": snapshot.type_names[snapshot.type_codes[i]],
+            "user_id": int(snapshot.user_ids[i]),
+            "price_per_km": float(snapshot.price[i]),
+            "capacity_kg": None if np.isnan(snapshot.capacity[i]) else float(snapshot.capacity[i]),
+            "pickup_km": round(float(pickup_km[i]), 2),
+            "total_km": round(float(total), 2),
+            "cost": round(float(c), 2),
+        } for i, total, c in zip(selected, total_km[top], cost[top])]
+    }
@@ -0,0 +1,157 @@
+"""
+repository.py
+----------
+Read queries of the hot routes.
+
+Each statement is a 2.0-style ``select()`` built once at import time with
+bound parameters, so a request only binds values: SQLAlchemy finds the
+compiled SQL in its statement cache without rebuilding the expression.
+Statements select plain columns instead of entities wherever the route only
+serializes data, which skips ORM identity-map and instance construction; the
+returned ``Row`` objects still support attribute access (``row.name``).
+
+``benchmark_queries.py`` compares these against the legacy
+``Model.query`` calls they replaced.
+"""
+
+from sqlalchemy import bindparam, select, tuple_
+
+from .message_store import thread_floor
+from .models import db, User, Product, Input, Transport, Negotiation, Message, NegotiationParticipant
+
+# -----------------------------------------------------------------------------
+# Users
+# -----------------------------------------------------------------------------
+
+_USER_BY_MOBILE = (
+    select(User.id, User.name, User.password)
+    .where(User.mobile_number == bindparam("mobile_number"))
+    .limit(1)
+)
+
+_USER_PROFILE = (
+    select(User.id, User.name, User.localization, User.mobile_number, User.photo)
+    .where(User.id == bindparam("user_id"))
+)
+
+
+def find_login_user(mobile_number):
+    """Row (id, name, password) of the user with `mobile_number`, or None."""
+    return db.session.execute(_USER_BY_MOBILE, {"mobile_number": mobile_number}).first()
+
+
+def mobile_number_taken(mobile_number):
+    return find_login_user(mobile_number) is not None
+
+
+def user_profile(user_id):
+    """Row (id, name, localization, mobile_number, photo), or None."""
+    return db.session.execute(_USER_PROFILE, {"user_id": user_id}).first()
+
+
+# -----------------------------------------------------------------------------
+# Listings
+# -----------------------------------------------------------------------------
+
+_PRODUCTS = select(
+    Product.id, Product.name, Product.price, Product.quantity, Product.publish_date, Product.user_id
+).where(Product.deleted_at.is_(None))
+
+_INPUTS = select(
+    Input.id, Input.name, Input.price, Input.quantity, Input.publish_date, Input.user_id
+).where(Input.deleted_at.is_(None))
+
+_TRANSPORTS = select(
+    Transport.id, Transport.transport_type, Transport.name, Transport.price_per_km,
+    Transport.latitude, Transport.longitude, Transport.capacity_kg, Transport.user_id
+).where(Transport.deleted_at.is_(None))
+
+
+def list_products():
+    return db.session.execute(_PRODUCTS).all()
+
+
+def list_inputs():
+    return db.session.execute(_INPUTS).all()
+
+
+def list_transports():
+    return db.session.execute(_TRANSPORTS).all()
+
+
+# -----------------------------------------------------------------------------
+# Negotiations and messages
+# -----------------------------------------------------------------------------
+
+_NEGOTIATIONS_BY_USER = select(
+    Negotiation.id, Negotiation.messages, Negotiation.created_at,
+    Negotiation.product_id, Negotiation.input_id, Negotiation.transport_id
+).where(Negotiation.user_id == bindparam("user_id"))
+
+_THREAD_MESSAGES = (
+    select(Message.id, Message.sender_id, Message.body, Message.timestamp)
+    .where(
+        Message.negotiation_id == bindparam("negotiation_id"),
+        Message.timestamp >= bindparam("since")
+    )
+    .order_by(Message.timestamp.asc())
+)
+
+
+_IS_PARTICIPANT = select(NegotiationParticipant.role).where(
+    NegotiationParticipant.negotiation_id == bindparam("negotiation_id"),
+    NegotiationParticipant.user_id == bindparam("user_id")
+)
+
+_PARTICIPANT_IDS = select(NegotiationParticipant.user_id).where(
+    NegotiationParticipant.negotiation_id == bindparam("negotiation_id")
+)
+
+_INBOX = (
+    select(
+        Negotiation.id, Negotiation.created_at, Negotiation.closed_at,
+        Negotiation.product_id, Negotiation.input_id, Negotiation.transport_id,
+        NegotiationParticipant.role, NegotiationParticipant.last_activity
+    )
+    .join(Negotiation, Negotiation.id == NegotiationParticipant.negotiation_id)
+    .where(
+        NegotiationParticipant.user_id == bindparam("user_id"),
+        # Keyset cursor: the id breaks ties between equal activity times
+        tuple_(NegotiationParticipant.last_activity, NegotiationParticipant.negotiation_id)
+        < tuple_(
+            bindparam("before", type_=NegotiationParticipant.last_activity.type),
+            bindparam("before_id", type_=NegotiationParticipant.negotiation_id.type)
+        )
+    )
+    .order_by(NegotiationParticipant.last_activity.desc(), NegotiationParticipant.negotiation_id.desc())
+    .limit(bindparam("limit"))
+)
+
+
+def is_participant(negotiation_id, user_id):
+    return db.session.execute(
+        _IS_PARTICIPANT, {"negotiation_id": negotiation_id, "user_id": user_id}
+    ).first() is not None
+
+
+def participant_ids(negotiation_id):
+    return db.session.execute(_PARTICIPANT_IDS, {"negotiation_id": negotiation_id}).scalars().all()
+
+
+def inbox(user_id, before, before_id, limit):
+    """Negotiations of `user_id` after the cursor (`before`, `before_id`), most recent first."""
+    return db.session.execute(
+        _INBOX, {"user_id": user_id, "before": before, "before_id": before_id, "limit": limit}
+    ).all()
+
+
+def negotiations_of(user_id):
+    return db.session.execute(_NEGOTIATIONS_BY_USER, {"user_id": user_id}).all()
+
+
+def thread_messages(negotiation):
+    """Rows (id, sender_id, body, timestamp) of a negotiation, oldest first."""
+    return db.session.execute(
+        _THREAD_MESSAGES,
+        {"negotiation_id": negotiation.id, "since": thread_floor(negotiation)}
+    ).all()
@@ -9,13 +9,21 @@ Features:
     - Modular structure using Flask Blueprints
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, abort, current_app
 from flask_jwt_extended import (create_access_token, jwt_required, get_jwt_identity)
 
 
 from datetime import datetime, timedelta, timezone
+from sqlalchemy import update
 from werkzeug.security import generate_password_hash, check_password_hash
-from ..models import db, User, Product, Input, Transport, Negotiation, Message
+from ..models import db, User, Product, Input, Transport, Negotiation, Message, NegotiationParticipant
+from ..jobs import enqueue
+from ..analytics import LISTING_MODELS, BUCKETS, price_series
+from ..message_store import ArchiveUnavailable, read_archived_messages
+from .. import repository
+from ..idempotency import idempotent
+from ..sync import catalog_version, changes_since, soft_delete
+from ..quotes import quote
 
 #---------------------------------------------------------------------------------
 # Blueprints Declarations
@@ -25,12 +33,27 @@ product_bp = Blueprint("products", __name__, url_prefix="/api/v1/products")
 input_bp = Blueprint("inputs", __name__, url_prefix="/api/v1/inputs")
 transport_bp = Blueprint("transports", __name__, url_prefix="/api/v1/transports")
 negotiation_bp = Blueprint("negotiations", __name__, url_prefix="/api/v1/negotiations")
+analytics_bp = Blueprint("analytics", __name__, url_prefix="/api/v1/analytics")
+sync_bp = Blueprint("sync", __name__, url_prefix="/api/v1/sync")
+
+
+def _catalog_etag(name, model):
+    """ETag of a listing table, derived from its latest change token."""
+    return f"{name}-{catalog_version(model)}"
+
+
+def _not_modified(etag):
+    response = jsonify()
+    response.status_code = 304
+    response.set_etag(etag)
+    return response
 
 #-------------------------------------------------------------------------------------
 # USER ROUTES
 #-------------------------------------------------------------------------------------
 
 @user_bp.route("/register", methods=["POST"], endpoint='user_register')
+@idempotent
 def register_user():
     """Register a new user safely"""
     data = request.get_json()
@@ -45,7 +68,7 @@ def register_user():
             return jsonify({"error": f"'{field}' is required"}), 400
 
     # Check if mobile number is already registered
-    if User.query.filter_by(mobile_number=data.get("mobile_number")).first():
+    if repository.mobile_number_taken(data.get("mobile_number")):
         return jsonify({"error": "Mobile number already registered"}), 409
 
     # Hash password
@@ -70,7 +93,7 @@ def register_user():
 def login_user():
     """Authenticate and return access token."""
     data = request.get_json()
-    user = User.query.filter_by(mobile_number=data.get("mobile_number")).first()
+    user = repository.find_login_user(data.get("mobile_number"))
     if not user or not check_password_hash(user.password, data.get("password")):
         return jsonify({"error": "Invalid credentials"}), 401
     
@@ -87,7 +110,9 @@ def login_user():
 def get_profile():
     """Retrieve logged-in user's profile"""
     user_id = int(get_jwt_identity())
-    user = User.query.get_or_404(user_id)
+    user = repository.user_profile(user_id)
+    if user is None:
+        abort(404)
     return jsonify({
         "id": user.id,
         "name": user.name,
@@ -103,6 +128,7 @@ def get_profile():
 
 @product_bp.route("", methods=["POST"], endpoint='product_get')
 @jwt_required()
+@idempotent
 def add_product():
     """Publish a new product."""
     user_id = int(get_jwt_identity())
@@ -117,6 +143,8 @@ def add_product():
     )
 
     db.session.add(product)
+    db.session.flush()
+    enqueue("analytics.record_price", {"kind": "product", "listing_id": product.id})
     db.session.commit()
 
     return jsonify({"message": "Product added successfully", "product_id": product.id}), 201
@@ -125,7 +153,11 @@ def add_product():
 @product_bp.route("", methods=["GET"], endpoint='product_list')
 def list_products():
     """List all products."""
-    products = Product.query.all()
+    etag = _catalog_etag("products", Product)
+    if request.if_none_match.contains(etag):
+        return _not_modified(etag)
+
+    products = repository.list_products()
 
     result = [{
         "id": p.id,
@@ -136,7 +168,9 @@ def list_products():
 
     } for p in products]
 
-    return jsonify(result), 200
+    response = jsonify(result)
+    response.set_etag(etag)
+    return response, 200
 
 @product_bp.route("/<int:product_id>", methods=["DELETE"], endpoint='product_delete')
 @jwt_required()
@@ -145,10 +179,14 @@ def delete_product(product_id):
     user_id = int(get_jwt_identity())
     product = Product.query.get_or_404(product_id)
 
+    if product.deleted_at is not None:
+        return jsonify({"error": "Product not found"}), 404
+
     if product.user_id != user_id:
         return jsonify({"error": "unauthorized"}), 403
     
-    db.session.delete(product)
+    # Soft delete, so sync clients receive a tombstone
+    soft_delete(product)
     db.session.commit()
     return jsonify({"message": "Product deleted."}), 200
 
@@ -159,6 +197,7 @@ def delete_product(product_id):
 
 @input_bp.route("", methods=["POST"], endpoint='input_add')
 @jwt_required()
+@idempotent
 def add_input():
     """Add an agricultural Input."""
     user_id = int(get_jwt_identity())
@@ -173,6 +212,8 @@ def add_input():
     )
 
     db.session.add(new_input)
+    db.session.flush()
+    enqueue("analytics.record_price", {"kind": "input", "listing_id": new_input.id})
     db.session.commit()
 
     return jsonify({"message": "Input added successfully", "input_id": new_input.id}), 201
@@ -182,7 +223,11 @@ def add_input():
 def list_inputs():
     """List all agricultural inputs"""
 
-    inputs = Input.query.all()
+    etag = _catalog_etag("inputs", Input)
+    if request.if_none_match.contains(etag):
+        return _not_modified(etag)
+
+    inputs = repository.list_inputs()
 
     result = [{
         "id":i.id,
@@ -193,7 +238,9 @@ def list_inputs():
         "user_id": i.user_id
     } for i in inputs]
 
-    return jsonify(result), 200
+    response = jsonify(result)
+    response.set_etag(etag)
+    return response, 200
 
 
 # -----------------------------------------------------------------------------------
@@ -202,16 +249,33 @@ def list_inputs():
 
 @transport_bp.route("", methods=["POST"], endpoint='transport_add')
 @jwt_required()
+@idempotent
 def add_transport():
     """Add a transport service"""
 
     user_id = int(get_jwt_identity())
     data = request.get_json()
 
+    # Optional base location and capacity, used by the quote endpoint
+    for field, low, high in (("latitude", -90, 90), ("longitude", -180, 180)):
+        value = data.get(field)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))
+                                  or not low <= value <= high):
+            return jsonify({"error": f"'{field}' must be a number between {low} and {high}"}), 400
+    if (data.get("latitude") is None) != (data.get("longitude") is None):
+        return jsonify({"error": "'latitude' and 'longitude' must be given together"}), 400
+    capacity = data.get("capacity_kg")
+    if capacity is not None and (isinstance(capacity, bool) or not isinstance(capacity, (int, float))
+                                 or not capacity > 0):
+        return jsonify({"error": "'capacity_kg' must be a positive number"}), 400
+
     transport = Transport(
         transport_type=data["transport_type"],
         name=data["name"],
         price_per_km=data["price_per_km"],
+        latitude=data.get("latitude"),
+        longitude=data.get("longitude"),
+        capacity_kg=data.get("capacity_kg"),
         photo=data.get("photo"),
         user_id=user_id
     )
@@ -228,15 +292,61 @@ def add_transport():
 @transport_bp.route("", methods=["GET"], endpoint='transport_list')
 def list_transports():
     """List all transport services."""
-    transports = Transport.query.all()
+    etag = _catalog_etag("transports", Transport)
+    if request.if_none_match.contains(etag):
+        return _not_modified(etag)
+
+    transports = repository.list_transports()
     result = [{
         "id": t.id,
         "transport_type": t.transport_type,
         "name": t.name,
         "price_per_km": t.price_per_km,
+        "latitude": t.latitude,
+        "longitude": t.longitude,
+        "capacity_kg": t.capacity_kg,
         "user_id": t.user_id
     } for t in transports]
 
+    response = jsonify(result)
+    response.set_etag(etag)
+    return response, 200
+
+
+@transport_bp.route("/quote", methods=["GET"], endpoint='transport_quote')
+def quote_transports():
+    """
+        Cheapest transport offers for a trip, ranked by cost then distance.
+
+        Query parameters: origin_lat, origin_lon, dest_lat, dest_lon (degrees)
+        and quantity (cargo in kg) are required; k (number of quotes, default
+        10, max 100), transport_type and max_pickup_km are optional.
+    """
+
+    try:
+        origin = (float(request.args["origin_lat"]), float(request.args["origin_lon"]))
+        destination = (float(request.args["dest_lat"]), float(request.args["dest_lon"]))
+        quantity = float(request.args["quantity"])
+    except KeyError as e:
+        return jsonify({"error": f"'{e.args[0]}' is required"}), 400
+    except ValueError:
+        return jsonify({"error": "Coordinates and 'quantity' must be numbers"}), 400
+
+    for lat, lon in (origin, destination):
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            return jsonify({"error": "Coordinates out of range"}), 400
+    if not quantity >= 0:
+        return jsonify({"error": "'quantity' must not be negative"}), 400
+
+    try:
+        k = min(int(request.args.get("k", 10)), 100)
+        max_pickup_km = float(request.args["max_pickup_km"]) if "max_pickup_km" in request.args else None
+    except ValueError:
+        return jsonify({"error": "'k' must be an integer and 'max_pickup_km' a number"}), 400
+    if k < 1:
+        return jsonify({"error": "'k' must be positive"}), 400
+
+    result = quote(origin, destination, quantity, k, request.args.get("transport_type"), max_pickup_km)
     return jsonify(result), 200
 
 
@@ -246,12 +356,23 @@ def list_transports():
 
 @negotiation_bp.route("", methods=["POST"], endpoint='negotiation_start')
 @jwt_required()
+@idempotent
 def start_negotiation():
     """Start a negotiation related to a product/input/transport"""
 
     user_id = int(get_jwt_identity())
     data = request.get_json()
 
+    # Owners of the listings under discussion become participants too
+    owner_ids = set()
+    for model, field in ((Product, "product_id"), (Input, "input_id"), (Transport, "transport_id")):
+        if data.get(field) is not None:
+            listing = db.session.get(model, data[field])
+            if listing is None or listing.deleted_at is not None:
+                return jsonify({"error": f"'{field}' does not exist"}), 404
+            owner_ids.add(listing.user_id)
+    owner_ids.discard(user_id)
+
     negotiation = Negotiation(
         user_id=user_id,
         product_id=data.get("product_id"),
@@ -261,6 +382,15 @@ def start_negotiation():
     )
 
     db.session.add(negotiation)
+    db.session.flush()
+
+    now = datetime.utcnow()
+    db.session.add(NegotiationParticipant(
+        negotiation_id=negotiation.id, user_id=user_id, role="initiator", last_activity=now))
+    db.session.add_all(
+        NegotiationParticipant(negotiation_id=negotiation.id, user_id=owner_id, role="owner", last_activity=now)
+        for owner_id in owner_ids
+    )
     db.session.commit()
 
     return jsonify({"message": "megotiation started", "negotiation_id": negotiation.id}), 201
@@ -273,7 +403,7 @@ def list_negotiations():
     """List all negotiations of the logged-in user."""
 
     user_id = int(get_jwt_identity())
-    negotiations = Negotiation.query.filter_by(user_id=user_id).all()
+    negotiations = repository.negotiations_of(user_id)
 
     result = [{
         "id": n.id,
@@ -287,12 +417,69 @@ def list_negotiations():
     return jsonify(result), 200
 
 
+@negotiation_bp.route("/inbox", methods=["GET"], endpoint='negotiations_inbox')
+@jwt_required()
+def negotiations_inbox():
+    """
+        Negotiations the logged-in user takes part in (as initiator or listing
+        owner), most recently active first.
+
+        Query parameters: limit (default 50, max 200), and before and
+        before_id (the 'last_activity' and 'id' of the last item of the
+        previous page).
+    """
+
+    user_id = int(get_jwt_identity())
+
+    try:
+        limit = min(int(request.args.get("limit", 50)), 200)
+        before = datetime.fromisoformat(request.args["before"]) if "before" in request.args else datetime.max
+        before_id = int(request.args.get("before_id", 0))
+    except ValueError:
+        return jsonify({"error": "'limit' and 'before_id' must be integers and 'before' an ISO timestamp"}), 400
+    if limit < 1:
+        return jsonify({"error": "'limit' must be positive"}), 400
+
+    result = [{
+        "id": n.id,
+        "role": n.role,
+        "last_activity": n.last_activity.isoformat(),
+        "created_at": n.created_at,
+        "closed_at": n.closed_at,
+        "product_id": n.product_id,
+        "input_id": n.input_id,
+        "transport_id": n.transport_id
+    } for n in repository.inbox(user_id, before, before_id, limit)]
+
+    return jsonify(result), 200
+
+
+@negotiation_bp.route("/<int:negotiation_id>/close", methods=["POST"], endpoint='negotiation_close')
+@jwt_required()
+@idempotent
+def close_negotiation(negotiation_id):
+    """Close a negotiation (only by its initiator). Closed threads accept no new messages."""
+
+    user_id = int(get_jwt_identity())
+    negotiation = Negotiation.query.get_or_404(negotiation_id)
+
+    if negotiation.user_id != user_id:
+        return jsonify({"error": "unauthorized"}), 403
+
+    if negotiation.closed_at is None:
+        negotiation.closed_at = datetime.utcnow()
+        db.session.commit()
+
+    return jsonify({"message": "Negotiation closed.", "closed_at": negotiation.closed_at.isoformat()}), 200
+
+
 # --------------------------------------------------------------------------------------------
 # MESSAGE ROUTES
 # --------------------------------------------------------------------------------------------
 
 @negotiation_bp.route("/<int:negotiation_id>/messages", methods=["POST"], endpoint='message_send')
 @jwt_required()
+@idempotent
 def send_message(negotiation_id):
     """
         Send a message within a negotiation thread.
@@ -302,7 +489,13 @@ def send_message(negotiation_id):
     user_id = int(get_jwt_identity())
     data = request.get_json()
 
-    negotiation = Negotiation.query.get_or_404(negotiation_id)
+    negotiation = db.get_or_404(Negotiation, negotiation_id)
+
+    if not repository.is_participant(negotiation.id, user_id):
+        return jsonify({"error": "unauthorized"}), 403
+
+    if negotiation.closed_at is not None:
+        return jsonify({"error": "Negotiation is closed"}), 409
 
     message = Message(
         sender_id=user_id,
@@ -312,6 +505,17 @@ def send_message(negotiation_id):
     )
 
     db.session.add(message)
+    db.session.flush()
+
+    # Move the thread to the top of every participant's inbox
+    db.session.execute(
+        update(NegotiationParticipant)
+        .where(NegotiationParticipant.negotiation_id == negotiation.id)
+        .values(last_activity=datetime.utcnow())
+    )
+
+    # Notifications run in the job worker, outside the request path
+    enqueue("negotiation.message_sent", {"message_id": message.id})
     db.session.commit()
 
     return jsonify({
@@ -336,9 +540,20 @@ def get_messages(negotiation_id):
     """
 
     user_id = int(get_jwt_identity())
-    negotiation = Negotiation.query.get_or_404(negotiation_id)
+    negotiation = db.get_or_404(Negotiation, negotiation_id)
+
+    if not repository.is_participant(negotiation.id, user_id):
+        return jsonify({"error": "unauthorized"}), 403
+
+    # Archived threads are served from their cold storage file
+    if negotiation.archived_at is not None:
+        try:
+            return jsonify(read_archived_messages(negotiation.id)), 200
+        except ArchiveUnavailable as e:
+            current_app.logger.error("Archived messages unavailable: %s", e)
+            return jsonify({"error": "Archived messages are temporarily unavailable"}), 503
 
-    messages = Message.query.filter_by(negotiation_id=negotiation.id).order_by(Message.timestamp.asc()).all()
+    messages = repository.thread_messages(negotiation)
 
     result = [{
         "id": m.id,
@@ -347,4 +562,76 @@ def get_messages(negotiation_id):
         "timestamp": m.timestamp.isoformat()
     } for m in messages]
 
-    return jsonify(result), 200
\ No newline at end of file
+    return jsonify(result), 200
+
+
+# --------------------------------------------------------------------------------------------
+# ANALYTICS ROUTES
+# --------------------------------------------------------------------------------------------
+
+@analytics_bp.route("/prices", methods=["GET"], endpoint='analytics_prices')
+def get_price_statistics():
+    """
+        Price trend (count, avg, min, max) for an item, read from the rollups.
+
+        Query parameters: name (required), kind ('product' or 'input'),
+        bucket ('day' or 'week'), region, from and to (YYYY-MM-DD).
+    """
+
+    name = request.args.get("name")
+    kind = request.args.get("kind", "product")
+    bucket = request.args.get("bucket", "day")
+
+    if not name:
+        return jsonify({"error": "'name' is required"}), 400
+    if kind not in LISTING_MODELS:
+        return jsonify({"error": "'kind' must be 'product' or 'input'"}), 400
+    if bucket not in BUCKETS:
+        return jsonify({"error": "'bucket' must be 'day' or 'week'"}), 400
+
+    try:
+        start = datetime.strptime(request.args["from"], "%Y-%m-%d").date() if "from" in request.args else None
+        end = datetime.strptime(request.args["to"], "%Y-%m-%d").date() if "to" in request.args else None
+    except ValueError:
+        return jsonify({"error": "'from' and 'to' must be YYYY-MM-DD dates"}), 400
+
+    series = price_series(kind, name, bucket, request.args.get("region"), start, end)
+
+    return jsonify({
+        "name": name,
+        "kind": kind,
+        "bucket": bucket,
+        "region": request.args.get("region"),
+        "series": series
+    }), 200
+
+
+# --------------------------------------------------------------------------------------------
+# SYNC ROUTES
+# --------------------------------------------------------------------------------------------
+
+@sync_bp.route("", methods=["GET"], endpoint='catalog_sync')
+def sync_catalog():
+    """
+        Catalog changes (upserts and deletions) since a change token.
+
+        Query parameters: since (token from the previous sync, default 0 for a
+        full snapshot) and limit (max changes per page, default 500, max 1000).
+        Keep calling with the returned token while 'has_more' is true.
+    """
+
+    try:
+        since = int(request.args.get("since", 0))
+        limit = min(int(request.args.get("limit", 500)), 1000)
+    except ValueError:
+        return jsonify({"error": "'since' and 'limit' must be integers"}), 400
+    if since < 0 or limit < 1:
+        return jsonify({"error": "'since' and 'limit' must be positive"}), 400
+
+    etag = f"sync-{since}-{limit}-{max(catalog_version(m) for m in (Product, Input, Transport))}"
+    if request.if_none_match.contains(etag):
+        return _not_modified(etag)
+
+    response = jsonify(changes_since(since, limit))
+    response.set_etag(etag)
+    return response, 200
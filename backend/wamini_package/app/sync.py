@@ -0,0 +1,138 @@
+"""
+sync.py
+----------
+Delta sync of the listing catalog (products, inputs, transports).
+
+Every insert or update of a listing, including soft deletes, is stamped with
+a ``change_seq`` taken from the 'catalog' row of ``sync_counters`` just before
+the flush. Incrementing that row locks it until commit, so change tokens
+become visible in increasing order and a client that has seen token N can
+never miss a later commit with a token <= N.
+
+A sync is then an index range scan on ``change_seq > since`` per table, so
+its cost is proportional to the number of changes, not to the catalog size.
+Deleted listings keep their row with ``deleted_at`` set (tombstone) and are
+reported under ``deletions``.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import event, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from .models import db, Product, Input, Transport, SyncCounter
+
+COUNTER_NAME = "catalog"
+
+SYNCED_MODELS = {
+    "products": Product,
+    "inputs": Input,
+    "transports": Transport,
+}
+
+_SYNCED_TYPES = tuple(SYNCED_MODELS.values())
+
+
+def _reserve(session, count):
+    """Advance the catalog counter by `count` and return its new value."""
+    conn = session.connection()
+    counter = SyncCounter.__table__
+    result = conn.execute(
+        update(counter)
+        .where(counter.c.name == COUNTER_NAME)
+        .values(value=counter.c.value + count)
+    )
+    if result.rowcount == 0:
+        conn.execute(insert(counter).values(name=COUNTER_NAME, value=count))
+    return conn.execute(select(counter.c.value).where(counter.c.name == COUNTER_NAME)).scalar_one()
+
+
+@event.listens_for(Session, "before_flush")
+def _stamp_changes(session, flush_context, instances):
+    """Give every new or modified listing a fresh change token."""
+    changed = [
+        obj for obj in session.new if isinstance(obj, _SYNCED_TYPES)
+    ] + [
+        obj for obj in session.dirty
+        if isinstance(obj, _SYNCED_TYPES) and session.is_modified(obj)
+    ]
+    if not changed:
+        return
+
+    last = _reserve(session, len(changed))
+    now = datetime.utcnow()
+    for offset, obj in enumerate(changed):
+        obj.change_seq = last - len(changed) + 1 + offset
+        obj.updated_at = now
+
+
+def soft_delete(listing):
+    """Mark a listing as deleted; the tombstone is picked up by the next sync."""
+    listing.deleted_at = datetime.utcnow()
+
+
+def catalog_version(model):
+    """Latest change token of one listing table (0 when empty)."""
+    return db.session.execute(select(func.max(model.change_seq))).scalar() or 0
+
+
+def serialize(kind, listing):
+    """JSON representation of a listing for sync clients."""
+    data = {
+        "id": listing.id,
+        "name": listing.name,
+        "publish_date": listing.publish_date,
+        "updated_at": listing.updated_at,
+        "photo": listing.photo,
+        "user_id": listing.user_id,
+    }
+    if kind == "transports":
+        data["transport_type"] = listing.transport_type
+        data["price_per_km"] = listing.price_per_km
+        data["latitude"] = listing.latitude
+        data["longitude"] = listing.longitude
+        data["capacity_kg"] = listing.capacity_kg
+    else:
+        data["quantity"] = listing.quantity
+        data["price"] = listing.price
+    return data
+
+
+def changes_since(since, limit):
+    """
+    Collect catalog changes with a token greater than `since`.
+
+    Returns:
+        dict: 'token' to send as the next `since`, 'has_more', and the
+              'upserts'/'deletions' grouped by table.
+    """
+    changed = []
+    for kind, model in SYNCED_MODELS.items():
+        rows = db.session.execute(
+            select(model)
+            .where(model.change_seq > since)
+            .order_by(model.change_seq.asc())
+            .limit(limit + 1)
+        ).scalars().all()
+        changed.extend((row.change_seq, kind, row) for row in rows)
+
+    # Each table returned its first limit+1 changes, so the first `limit`
+    # entries of the merged list are exactly the next `limit` changes overall.
+    changed.sort(key=lambda entry: entry[0])
+    has_more = len(changed) > limit
+    changed = changed[:limit]
+
+    upserts = {kind: [] for kind in SYNCED_MODELS}
+    deletions = {kind: [] for kind in SYNCED_MODELS}
+    for _, kind, row in changed:
+        if row.deleted_at is not None:
+            deletions[kind].append(row.id)
+        else:
+            upserts[kind].append(serialize(kind, row))
+
+    return {
+        "token": str(changed[-1][0] if changed else since),
+        "has_more": has_more,
+        "upserts": upserts,
+        "deletions": deletions,
+    }